@@ -0,0 +1,397 @@
+"""
+FINRA Rules ANN Evaluation - recall@k vs latency
+Measures how many of the exact top-k sections an approximate vector index returns.
+
+1. Builds a query set from section titles (pseudo-queries) or the bundled markdown corpus
+2. Computes exact top-k by brute force over every section embedding
+3. Sweeps ivfflat (lists/probes) and HNSW (m/ef_search) on a scratch copy of the embeddings
+4. Measures the shipped search paths (qa.py on the live partitioned tables: global,
+   series-filtered and coarse-to-fine) against the same ground truth
+5. Reports recall@k and latency per setting so index parameters can be picked from data
+"""
+
+import io
+import os
+import re
+import csv
+import json
+import time
+import contextlib
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from qa import FINRAQuestionAnswering
+
+IVFFLAT_LISTS = [10, 25, 50, 100]
+IVFFLAT_PROBES = [1, 5, 10, 25]
+HNSW_M = [8, 16, 32]
+HNSW_EF_SEARCH = [10, 40, 100]
+HNSW_EF_CONSTRUCTION = 64
+
+
+class ANNRecallEvaluator:
+    def __init__(self, pg_config: dict):
+        """Initialize PostgreSQL connection and embedding model"""
+        print("Connecting to PostgreSQL...")
+        self.conn = psycopg2.connect(**pg_config)
+        self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+        self.cursor.execute("SET search_path TO finra_live, public;")
+        self.conn.commit()
+        print("✓ Connected to PostgreSQL")
+
+        print("\nLoading embedding model...")
+        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        print("✓ Embedding model loaded")
+
+        self.section_ids = None
+        self.section_series = None
+        self.section_matrix = None
+        self.section_titles = []
+
+    def load_sections(self):
+        """Load every section embedding into memory for brute-force search"""
+        print("\nLoading section embeddings...")
+        self.cursor.execute("""
+            SELECT s.id, s.rule_series, s.embedding::text as embedding,
+                   substr(d.content, s.start_offset + 1, LEAST(s.end_offset - s.start_offset, 300)) as content
+            FROM sections s
+            JOIN documents d ON d.id = s.document_id
+            WHERE s.embedding IS NOT NULL
+            ORDER BY s.id;
+        """)
+        rows = self.cursor.fetchall()
+
+        self.section_ids = np.array([row['id'] for row in rows])
+        self.section_series = np.array([row['rule_series'] for row in rows])
+        matrix = np.array([json.loads(row['embedding']) for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.section_matrix = matrix / norms
+
+        # First line of each section is its title, e.g. "**Supervisory System.**"
+        self.section_titles = []
+        for row in rows:
+            first_line = row['content'].split('\n', 1)[0]
+            title = re.sub(r'[*#_]', '', first_line).strip()
+            if len(title) > 10:
+                self.section_titles.append(title[:200])
+
+        print(f"✓ Loaded {len(self.section_ids)} sections ({self.section_matrix.shape[1]} dims)")
+
+    def build_query_set(self, source: str = 'titles', corpus_dir: str = 'tarannumpdf_output',
+                        max_queries: int = 200, seed: int = 42) -> List[str]:
+        """
+        Build pseudo-queries
+
+        Args:
+            source: 'titles' (section titles from the database) or 'corpus'
+                    (headings from the bundled markdown files)
+            corpus_dir: Directory with converted markdown files
+            max_queries: Sample size
+            seed: Sampling seed so runs are comparable
+        """
+        if source == 'corpus':
+            queries = []
+            for file_name in sorted(os.listdir(corpus_dir)):
+                if not file_name.endswith('.md'):
+                    continue
+                with open(os.path.join(corpus_dir, file_name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        heading = re.match(r'^#{1,6}\s+(.+)', line)
+                        if heading:
+                            text = re.sub(r'[*_]|\([A-Za-z0-9]+\)', '', heading.group(1)).strip()
+                            if len(text) > 10:
+                                queries.append(text[:200])
+        else:
+            queries = list(self.section_titles)
+
+        queries = sorted(set(queries))
+        if len(queries) > max_queries:
+            rng = np.random.default_rng(seed)
+            queries = [queries[i] for i in sorted(rng.choice(len(queries), max_queries, replace=False))]
+
+        print(f"✓ Built {len(queries)} queries from {source}")
+        return queries
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed and L2-normalize queries"""
+        print("Generating query embeddings...")
+        embeddings = self.embedding_model.encode(queries, convert_to_numpy=True)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (embeddings / norms).astype(np.float32)
+
+    def exact_top_k(self, query_matrix: np.ndarray, k: int,
+                    series: Optional[List[str]] = None) -> List[set]:
+        """
+        Ground-truth top-k section ids by brute-force cosine similarity
+        
+        series: optional per-query rule series; each query's truth is then
+        limited to sections of that series
+        """
+        similarities = query_matrix @ self.section_matrix.T
+        if series is not None:
+            similarities = np.where(self.section_series[np.newaxis, :] == np.array(series)[:, np.newaxis],
+                                    similarities, -np.inf)
+        k = min(k, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        return [
+            set(self.section_ids[row][np.isfinite(similarities[i, row])].tolist())
+            for i, row in enumerate(top)
+        ]
+
+    def create_scratch_table(self):
+        """Copy embeddings into an unpartitioned temp table so index builds don't touch live tables"""
+        dims = self.section_matrix.shape[1]
+        self.cursor.execute("DROP TABLE IF EXISTS ann_eval_sections;")
+        self.cursor.execute(f"""
+            CREATE TEMP TABLE ann_eval_sections AS
+            SELECT id, embedding::vector({dims}) as embedding FROM sections
+            WHERE embedding IS NOT NULL;
+        """)
+        self.cursor.execute("ANALYZE ann_eval_sections;")
+        self.conn.commit()
+
+    def run_queries(self, query_matrix: np.ndarray, truth: List[set], k: int,
+                    use_index: bool = True) -> Optional[Tuple[float, float, float]]:
+        """
+        Run every query against ann_eval_sections; return (recall@k, mean ms, p95 ms)
+        
+        With use_index, sequential scans are disabled for the transaction (as the
+        pgvector docs advise for testing) and the plan is checked once, so a row
+        labelled with an index setting is never an exact scan. Returns None if
+        the planner still does not use ann_eval_idx.
+        """
+        sql = """
+            SELECT id FROM ann_eval_sections
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s;
+        """
+        self.cursor.execute(f"SET LOCAL enable_seqscan = {'off' if use_index else 'on'};")
+        if use_index:
+            self.cursor.execute("EXPLAIN " + sql, (query_matrix[0].tolist(), k))
+            plan = '\n'.join(row['QUERY PLAN'] for row in self.cursor.fetchall())
+            if 'ann_eval_idx' not in plan:
+                print("  ✗ Planner did not use ann_eval_idx - setting skipped")
+                return None
+        
+        recalls = []
+        latencies = []
+        for query_vector, expected in zip(query_matrix, truth):
+            start = time.perf_counter()
+            self.cursor.execute(sql, (query_vector.tolist(), k))
+            found = {row['id'] for row in self.cursor.fetchall()}
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(found & expected) / len(expected))
+        return float(np.mean(recalls)), float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+    def sweep(self, query_matrix: np.ndarray, k: int = 5) -> List[Dict]:
+        """Sweep index types and parameters; returns one result row per setting"""
+        truth = self.exact_top_k(query_matrix, k)
+        results = []
+
+        print("\n" + "="*80)
+        print(f"ANN SWEEP (recall@{k}, {len(query_matrix)} queries)")
+        print("="*80)
+
+        self.create_scratch_table()
+
+        # Baseline: sequential scan is exact, so recall is 1.0 by definition
+        recall, mean_ms, p95_ms = self.run_queries(query_matrix, truth, k, use_index=False)
+        results.append({'index': 'exact', 'build': '-', 'search': '-', 'build_s': 0.0,
+                        'recall': recall, 'mean_ms': mean_ms, 'p95_ms': p95_ms})
+        self.print_row(results[-1])
+
+        n_rows = len(self.section_ids)
+        for lists in IVFFLAT_LISTS:
+            if lists > n_rows:
+                continue
+            self.cursor.execute("DROP INDEX IF EXISTS ann_eval_idx;")
+            start = time.perf_counter()
+            self.cursor.execute(f"""
+                CREATE INDEX ann_eval_idx ON ann_eval_sections
+                USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists});
+            """)
+            build_s = time.perf_counter() - start
+
+            for probes in IVFFLAT_PROBES:
+                if probes > lists:
+                    continue
+                self.cursor.execute(f"SET ivfflat.probes = {probes};")
+                measured = self.run_queries(query_matrix, truth, k)
+                if measured is None:
+                    continue
+                recall, mean_ms, p95_ms = measured
+                results.append({'index': 'ivfflat', 'build': f"lists={lists}", 'search': f"probes={probes}",
+                                'build_s': build_s, 'recall': recall, 'mean_ms': mean_ms, 'p95_ms': p95_ms})
+                self.print_row(results[-1])
+
+        for m in HNSW_M:
+            self.cursor.execute("DROP INDEX IF EXISTS ann_eval_idx;")
+            start = time.perf_counter()
+            self.cursor.execute(f"""
+                CREATE INDEX ann_eval_idx ON ann_eval_sections
+                USING hnsw (embedding vector_cosine_ops) WITH (m = {m}, ef_construction = {HNSW_EF_CONSTRUCTION});
+            """)
+            build_s = time.perf_counter() - start
+
+            for ef_search in HNSW_EF_SEARCH:
+                if ef_search < k:
+                    # HNSW returns at most ef_search rows, so recall@k is capped below 1
+                    print(f"  hnsw     m={m:<8} ef_search={ef_search:<4} skipped (ef_search < k={k})")
+                    continue
+                self.cursor.execute(f"SET hnsw.ef_search = {ef_search};")
+                measured = self.run_queries(query_matrix, truth, k)
+                if measured is None:
+                    continue
+                recall, mean_ms, p95_ms = measured
+                results.append({'index': 'hnsw', 'build': f"m={m}", 'search': f"ef_search={ef_search}",
+                                'build_s': build_s, 'recall': recall, 'mean_ms': mean_ms, 'p95_ms': p95_ms})
+                self.print_row(results[-1])
+
+        self.cursor.execute("DROP TABLE IF EXISTS ann_eval_sections;")
+        self.cursor.execute("RESET ivfflat.probes;")
+        self.cursor.execute("RESET hnsw.ef_search;")
+        self.conn.commit()
+        return results
+
+    def evaluate_shipped(self, qa_engine: FINRAQuestionAnswering, queries: List[str],
+                         query_matrix: np.ndarray, k: int = 5) -> List[Dict]:
+        """
+        Recall of the search paths that ship, against brute-force ground truth
+        
+        Runs FINRAQuestionAnswering on the live partitioned tables with their
+        real indexes and settings (per-partition ivfflat, default probes, PCA
+        if stored):
+        - global: search_sections with no filter
+        - series: search_sections filtered to the series of each query's exact
+          top hit, scored against the exact top-k within that series
+        - coarse-to-fine: search_two_stage
+        A near-duplicate copy returned in place of its out-of-series
+        representative counts as a miss, so filtered recall is a lower bound.
+        """
+        truth = self.exact_top_k(query_matrix, k)
+        top_series = [
+            self.section_series[np.argmax(self.section_matrix @ query_vector)]
+            for query_vector in query_matrix
+        ]
+        series_truth = self.exact_top_k(query_matrix, k, top_series)
+        
+        # The GUC is undefined until pgvector is loaded in the backend; 1 is its default
+        qa_engine.cursor.execute("SELECT COALESCE(current_setting('ivfflat.probes', true), '1') as probes;")
+        settings = f"probes={qa_engine.cursor.fetchone()['probes']}"
+        
+        paths = [
+            ('global', lambda q, e, s: qa_engine.search_sections(q, k, query_embedding=e), truth),
+            ('series', lambda q, e, s: qa_engine.search_sections(q, k, series=s, query_embedding=e), series_truth),
+            ('coarse-to-fine', lambda q, e, s: qa_engine.search_two_stage(q, k, 0, query_embedding=e)[0], truth)
+        ]
+        
+        print("\n" + "="*80)
+        print(f"SHIPPED SEARCH PATHS (recall@{k}, {len(queries)} queries, {settings}, "
+              f"{qa_engine.embedding_column})")
+        print("="*80)
+        
+        results = []
+        for name, search, expected_sets in paths:
+            recalls = []
+            latencies = []
+            for query, query_vector, series, expected in zip(queries, query_matrix, top_series, expected_sets):
+                start = time.perf_counter()
+                # qa.py narrates every search; keep the sweep output readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rows = search(query, query_vector.tolist(), series)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found = {row['id'] for row in rows}
+                recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+            results.append({'index': 'shipped', 'build': name, 'search': settings, 'build_s': 0.0,
+                            'recall': float(np.mean(recalls)), 'mean_ms': float(np.mean(latencies)),
+                            'p95_ms': float(np.percentile(latencies, 95))})
+            self.print_row(results[-1])
+        return results
+    
+    def print_row(self, row: Dict):
+        """Print one sweep result"""
+        print(f"  {row['index']:<8} {row['build']:<14} {row['search']:<14} "
+              f"recall={row['recall']:.3f}  mean={row['mean_ms']:.2f}ms  p95={row['p95_ms']:.2f}ms  "
+              f"build={row['build_s']:.2f}s")
+
+    def recommend(self, results: List[Dict], min_recall: float = 0.95) -> Optional[Dict]:
+        """Fastest swept index setting that meets min_recall"""
+        candidates = [r for r in results if r['index'] not in ('exact', 'shipped') and r['recall'] >= min_recall]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda r: r['mean_ms'])
+
+    def save_csv(self, results: List[Dict], path: str):
+        """Write the recall/latency curve to CSV"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"✓ Results written to {path}")
+
+    def close(self):
+        """Close database connection"""
+        self.cursor.close()
+        self.conn.close()
+
+
+def main():
+    """Main execution"""
+    print("\n" + "="*80)
+    print("FINRA RULES ANN EVALUATION")
+    print("="*80 + "\n")
+
+    print("PostgreSQL Configuration:")
+    pg_config = {
+        'host': input("Host [localhost]: ").strip() or 'localhost',
+        'database': input("Database [finra_rules]: ").strip() or 'finra_rules',
+        'user': input("Username [postgres]: ").strip() or 'postgres',
+        'password': input("Password: ").strip(),
+        'port': int(input("Port [5432]: ").strip() or '5432')
+    }
+
+    print("\nEvaluation Configuration:")
+    source = input("Query source - titles or corpus [titles]: ").strip() or 'titles'
+    k = int(input("k for recall@k [5]: ").strip() or '5')
+    max_queries = int(input("Max queries [200]: ").strip() or '200')
+    output_path = input("CSV output [ann_eval_results.csv]: ").strip() or 'ann_eval_results.csv'
+    measure_shipped = (input("Also measure shipped qa.py search paths? [Y/n]: ").strip().lower() or 'y') == 'y'
+
+    try:
+        evaluator = ANNRecallEvaluator(pg_config)
+        evaluator.load_sections()
+        queries = evaluator.build_query_set(source, max_queries=max_queries)
+        query_matrix = evaluator.embed_queries(queries)
+
+        results = evaluator.sweep(query_matrix, k)
+        # Saved before the shipped paths run, so a failure there keeps the sweep
+        evaluator.save_csv(results, output_path)
+        if measure_shipped:
+            qa_engine = FINRAQuestionAnswering(pg_config, cache_size=0)
+            results += evaluator.evaluate_shipped(qa_engine, queries, query_matrix, k)
+            qa_engine.close()
+            evaluator.save_csv(results, output_path)
+
+        best = evaluator.recommend(results)
+        print("\n" + "="*80)
+        if best:
+            print(f"✓ Recommended: {best['index']} {best['build']} {best['search']} "
+                  f"(recall@{k}={best['recall']:.3f}, {best['mean_ms']:.2f}ms)")
+        else:
+            print("✗ No index setting reached recall 0.95 - keep exact search or widen the sweep")
+        print("="*80 + "\n")
+
+        evaluator.close()
+
+    except Exception as e:
+        print(f"\n✗ Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
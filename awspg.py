@@ -9,16 +9,74 @@ Key Changes:
 """
 
 import re
+import json
 import boto3
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import numpy as np
+from psycopg2.extras import RealDictCursor, execute_batch
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+from ecfr import ECFRXMLReader
+from dedupe import MinHashLSH
+
+# FINRA rule series used to list-partition sections and supplementary materials.
+# Rules whose number is not a 4-digit FINRA number land in the DEFAULT partition.
+RULE_SERIES = ['0000', '1000', '2000', '3000', '4000', '5000', '6000', '7000', '8000', '9000']
+
+# Blue/green schemas: every ingest builds into BUILD_SCHEMA, which is renamed to
+# LIVE_SCHEMA in one transaction. The previous live schema is kept as
+# VERSION_PREFIX + its build timestamp for rollback.
+LIVE_SCHEMA = 'finra_live'
+BUILD_SCHEMA = 'finra_build'
+VERSION_PREFIX = 'finra_v'
+# Tables of one corpus version. Runs before blue/green reindexing created them
+# in public; the first publish moves them (and their partitions) into LEGACY_VERSION.
+CORPUS_TABLES = ['rules', 'documents', 'sections', 'supplementary_materials',
+                 'rule_citations', 'near_duplicates', 'embedding_projection']
+LEGACY_VERSION = f"{VERSION_PREFIX}00000000000000"
+# Columns Q&A reads; a retained version without them (e.g. LEGACY_VERSION's
+# pre-series tables) cannot be rolled back to
+SEARCHABLE_COLUMNS = [('rules', 'rule_series'), ('documents', 'content'),
+                      ('sections', 'start_offset'), ('supplementary_materials', 'start_offset'),
+                      ('near_duplicates', 'duplicate_series'), ('rule_citations', 'to_label')]
+
+# ivfflat sizing per partition, following pgvector's rows / 1000 lists guidance.
+# Smaller partitions get no ANN index and are scanned exactly.
+IVFFLAT_ROWS_PER_LIST = 1000
+IVFFLAT_MIN_ROWS = 10000
+
+# Citation patterns: "Rule 2111(a)", "Rules 3110(b) and 3110", "paragraph (b)(3) of Rule 5131".
+# NASD/SEA/NYSE rule numbers live in other rulebooks and are skipped.
+RULE_REFERENCE_PATTERN = re.compile(
+    r'(?<!NASD )(?<!SEA )(?<!NYSE )\bRules?\s+\d{4}(?:\([A-Za-z0-9]+\))*'
+    r'(?:(?:\s*,\s*(?:and\s+|or\s+)?|\s+(?:and|or)\s+)\d{4}(?:\([A-Za-z0-9]+\))*)*'
+)
+PARAGRAPH_REFERENCE_PATTERN = re.compile(
+    r'\bparagraphs?\s+\([a-z]\)(?:\([A-Za-z0-9]+\))*'
+    r'(?:(?:\s*,\s*(?:and\s+|or\s+)?|\s+(?:and|or|through)\s+)\([a-z]\)(?:\([A-Za-z0-9]+\))*)*'
+    r'(?:\s+of\s+(?:FINRA\s+)?Rule\s+(\d{4}))?'
+)
+
+
+def rule_series(rule_number: str) -> str:
+    """Map a rule number to its series, e.g. '2111' -> '2000'"""
+    match = re.match(r'^(\d)\d{3}$', rule_number.strip())
+    if match:
+        return f"{match.group(1)}000"
+    return 'other'
+
 
 class S3PostgresVectorParser:
-    def __init__(self, pg_config: dict, aws_config: dict):
-        """Initialize S3, PostgreSQL connection and embedding model"""
+    def __init__(self, pg_config: dict, aws_config: dict, dedupe_threshold: Optional[float] = 0.85,
+                 keep_versions: int = 2):
+        """
+        Initialize S3, PostgreSQL connection and embedding model
+        
+        dedupe_threshold: estimated Jaccard similarity above which a section or
+        material reuses an already embedded near-duplicate (None disables)
+        keep_versions: previous live schemas retained for rollback after a publish
+        """
         print("Connecting to S3...")
         self.s3_client = boto3.client(
             's3',
@@ -39,10 +97,22 @@ class S3PostgresVectorParser:
         self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
         print("✓ Embedding model loaded (384-dimensional vectors)")
         
+        self.near_duplicates = MinHashLSH(dedupe_threshold) if dedupe_threshold else None
+        # LSH keys are (kind, rule_series, rule_number, label) -> embedded row id
+        self.embedded_rows = {}
+        self.embedding_stats = {'embedded': 0, 'reused': 0}
+        self.keep_versions = keep_versions
+        self.build_version = None
+        
         self.setup_database()
     
     def setup_database(self):
-        """Create PostgreSQL schema with rule_number as PRIMARY KEY"""
+        """
+        Create the tables (rule_number as PRIMARY KEY) in a fresh shadow build schema
+        
+        The live schema is never touched here; Q&A keeps serving it until
+        publish_build() swaps the finished build in.
+        """
         print("\n" + "="*80)
         print("SETTING UP VECTOR DATABASE")
         print("="*80)
@@ -51,11 +121,14 @@ class S3PostgresVectorParser:
         self.cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
         print("   ✓ pgvector extension enabled")
         
-        print("\n2. Dropping old tables if they exist...")
-        self.cursor.execute("DROP TABLE IF EXISTS supplementary_materials CASCADE;")
-        self.cursor.execute("DROP TABLE IF EXISTS sections CASCADE;")
-        self.cursor.execute("DROP TABLE IF EXISTS rules CASCADE;")
-        print("   ✓ Old tables dropped")
+        print("\n2. Creating shadow build schema...")
+        # A leftover build schema is an unpublished (failed or abandoned) run
+        self.cursor.execute(f"DROP SCHEMA IF EXISTS {BUILD_SCHEMA} CASCADE;")
+        self.cursor.execute(f"CREATE SCHEMA {BUILD_SCHEMA};")
+        self.cursor.execute(f"SET search_path TO {BUILD_SCHEMA}, public;")
+        self.conn.commit()
+        self.build_version = f"{VERSION_PREFIX}{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        print(f"   ✓ Building {self.build_version} in schema {BUILD_SCHEMA}")
         
         print("\n3. Creating tables with rule_number as PRIMARY KEY...")
         
@@ -63,64 +136,369 @@ class S3PostgresVectorParser:
         self.cursor.execute("""
             CREATE TABLE rules (
                 rule_number VARCHAR(20) PRIMARY KEY,
+                rule_series VARCHAR(10) NOT NULL,
                 title TEXT NOT NULL,
+                embedding vector(384),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
         print("   ✓ Rules table created (rule_number is PK)")
         
-        # Sections table - references rule_number
+        # Documents table - each source text stored once; sections point into it by offset
         self.cursor.execute("""
-            CREATE TABLE sections (
+            CREATE TABLE documents (
                 id SERIAL PRIMARY KEY,
+                rule_number VARCHAR(20) NOT NULL UNIQUE REFERENCES rules(rule_number) ON DELETE CASCADE,
+                source_key TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        print("   ✓ Documents table created (FK: rule_number)")
+        
+        # Sections table - references rule_number, list-partitioned by rule series
+        self.cursor.execute("""
+            CREATE TABLE sections (
+                id SERIAL,
                 rule_number VARCHAR(20) NOT NULL REFERENCES rules(rule_number) ON DELETE CASCADE,
+                rule_series VARCHAR(10) NOT NULL,
                 section_label VARCHAR(10) NOT NULL,
-                content TEXT NOT NULL,
-                embedding vector(384) NOT NULL,
+                document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                start_offset INTEGER NOT NULL,
+                end_offset INTEGER NOT NULL,
+                embedding vector(384),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                CONSTRAINT unique_rule_section UNIQUE(rule_number, section_label)
-            );
+                PRIMARY KEY (rule_series, id),
+                CONSTRAINT unique_rule_section UNIQUE(rule_series, rule_number, section_label)
+            ) PARTITION BY LIST (rule_series);
         """)
-        print("   ✓ Sections table created (FK: rule_number)")
+        print("   ✓ Sections table created (FK: rule_number, partitioned by rule_series)")
         
-        # Supplementary materials table - references rule_number
+        # Supplementary materials table - references rule_number, list-partitioned by rule series
         self.cursor.execute("""
             CREATE TABLE supplementary_materials (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 rule_number VARCHAR(20) NOT NULL REFERENCES rules(rule_number) ON DELETE CASCADE,
+                rule_series VARCHAR(10) NOT NULL,
                 material_number VARCHAR(10) NOT NULL,
                 title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                embedding vector(384) NOT NULL,
+                document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                start_offset INTEGER NOT NULL,
+                end_offset INTEGER NOT NULL,
+                embedding vector(384),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                CONSTRAINT unique_rule_material UNIQUE(rule_number, material_number)
-            );
+                PRIMARY KEY (rule_series, id),
+                CONSTRAINT unique_rule_material UNIQUE(rule_series, rule_number, material_number)
+            ) PARTITION BY LIST (rule_series);
         """)
-        print("   ✓ Supplementary materials table created (FK: rule_number)")
-        
-        self.conn.commit()
+        print("   ✓ Supplementary materials table created (FK: rule_number, partitioned by rule_series)")
         
-        print("\n4. Creating vector indexes...")
+        # Citation edges - from a section/material to a cited rule or rule paragraph.
+        # to_rule has no FK because rules outside the corpus are cited too.
         self.cursor.execute("""
-            CREATE INDEX IF NOT EXISTS sections_embedding_idx 
-            ON sections USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+            CREATE TABLE rule_citations (
+                id SERIAL PRIMARY KEY,
+                from_rule VARCHAR(20) NOT NULL REFERENCES rules(rule_number) ON DELETE CASCADE,
+                from_kind VARCHAR(20) NOT NULL,
+                from_label VARCHAR(10) NOT NULL,
+                to_rule VARCHAR(20) NOT NULL,
+                to_label VARCHAR(10),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
         """)
+        print("   ✓ Rule citations table created (edges: from rule/section -> to rule/section)")
+        
+        # Near-duplicate links - occurrences whose embedding is NULL point to the
+        # embedded representative (kind is 'section' or 'supplementary'); the
+        # series columns complete each side's partitioned primary key
         self.cursor.execute("""
-            CREATE INDEX IF NOT EXISTS supplementary_embedding_idx 
-            ON supplementary_materials USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+            CREATE TABLE near_duplicates (
+                id SERIAL PRIMARY KEY,
+                representative_kind VARCHAR(20) NOT NULL,
+                representative_series VARCHAR(10) NOT NULL,
+                representative_id INTEGER NOT NULL,
+                duplicate_kind VARCHAR(20) NOT NULL,
+                duplicate_series VARCHAR(10) NOT NULL,
+                duplicate_id INTEGER NOT NULL,
+                similarity REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
         """)
-        print("   ✓ Vector indexes created")
+        print("   ✓ Near-duplicates table created (occurrence -> embedded representative)")
+        
+        print("\n4. Creating rule series partitions...")
+        for table in ['sections', 'supplementary_materials']:
+            for series in RULE_SERIES:
+                self.cursor.execute(f"""
+                    CREATE TABLE {table}_s{series} PARTITION OF {table}
+                    FOR VALUES IN ('{series}');
+                """)
+            self.cursor.execute(f"CREATE TABLE {table}_other PARTITION OF {table} DEFAULT;")
+        print(f"   ✓ {len(RULE_SERIES)} series partitions + default partition per table")
+        
+        self.conn.commit()
         
         print("\n5. Creating foreign key indexes...")
         self.cursor.execute("CREATE INDEX IF NOT EXISTS sections_rule_number_idx ON sections(rule_number);")
         self.cursor.execute("CREATE INDEX IF NOT EXISTS supplementary_rule_number_idx ON supplementary_materials(rule_number);")
         print("   ✓ Foreign key indexes created")
         
+        print("\n6. Creating citation graph indexes...")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS rule_citations_from_idx ON rule_citations(from_rule, from_label);")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS rule_citations_to_idx ON rule_citations(to_rule, to_label);")
+        print("   ✓ Citation indexes created")
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS near_duplicates_representative_idx
+            ON near_duplicates(representative_kind, representative_id);
+        """)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS near_duplicates_duplicate_idx
+            ON near_duplicates(duplicate_kind, duplicate_id);
+        """)
+        
+        print("\n7. Ensuring corpus generation counter...")
+        # Lives in public, outside the versioned schemas: the counter must keep
+        # increasing across rebuilds so Q&A caches can tell the corpus changed
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS public.corpus_meta (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                generation BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        self.cursor.execute("ALTER TABLE public.corpus_meta ADD COLUMN IF NOT EXISTS live_version TEXT;")
+        self.cursor.execute("INSERT INTO public.corpus_meta (id, generation) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;")
+        
         self.conn.commit()
         print("\n✓ Database schema ready!")
         print("="*80 + "\n")
     
+    def create_partition_vector_indexes(self, column: str):
+        """
+        Create one ivfflat index per rule series partition on a vector column,
+        with lists sized from the partition's row count
+        
+        Each partition gets its own ANN index so a series-filtered query only
+        probes the partitions it needs instead of post-filtering a global top-k.
+        Partitions under IVFFLAT_MIN_ROWS rows are left unindexed: an exact scan
+        is cheap at that size, while a few-row-per-list index at probes=1 would
+        return fewer than k rows.
+        """
+        indexed, exact = 0, 0
+        for table, prefix in [('sections', 'sections'), ('supplementary_materials', 'supplementary')]:
+            for suffix in [f"s{series}" for series in RULE_SERIES] + ['other']:
+                self.cursor.execute(f"SELECT COUNT(*) as count FROM {table}_{suffix} WHERE {column} IS NOT NULL;")
+                rows = self.cursor.fetchone()['count']
+                if rows < IVFFLAT_MIN_ROWS:
+                    exact += 1
+                    continue
+                lists = max(1, rows // IVFFLAT_ROWS_PER_LIST)
+                self.cursor.execute(f"""
+                    CREATE INDEX IF NOT EXISTS {prefix}_{suffix}_{column}_idx 
+                    ON {table}_{suffix} USING ivfflat ({column} vector_cosine_ops) WITH (lists = {lists});
+                """)
+                print(f"   ✓ {table}_{suffix}: {rows} rows, lists = {lists}")
+                indexed += 1
+        self.conn.commit()
+        print(f"   ✓ {indexed} partitions indexed, {exact} under {IVFFLAT_MIN_ROWS} rows searched exactly")
+    
+    def compute_rule_centroids(self, column: str = 'embedding'):
+        """
+        Store one aggregate embedding per rule: the mean of its sections' and
+        materials' vectors (near-duplicates count via their representative).
+        Used by the Q&A engine to pick candidate rules before ranking sections;
+        there is one row per rule, so it is scanned exactly and not indexed.
+        """
+        print(f"\nComputing rule centroids ({column})...")
+        self.cursor.execute(f"""
+            WITH items AS (
+                SELECT 'section' as kind, rule_series, id, rule_number, {column} as embedding FROM sections
+                UNION ALL
+                SELECT 'supplementary', rule_series, id, rule_number, {column} FROM supplementary_materials
+            ),
+            resolved AS (
+                SELECT i.rule_number, COALESCE(i.embedding, rep.embedding) as embedding
+                FROM items i
+                LEFT JOIN near_duplicates nd
+                    ON i.embedding IS NULL AND nd.duplicate_kind = i.kind AND nd.duplicate_id = i.id
+                LEFT JOIN items rep
+                    ON rep.kind = nd.representative_kind
+                    AND rep.rule_series = nd.representative_series
+                    AND rep.id = nd.representative_id
+            )
+            UPDATE rules r
+            SET {column} = c.centroid
+            FROM (
+                SELECT rule_number, AVG(embedding) as centroid
+                FROM resolved
+                WHERE embedding IS NOT NULL
+                GROUP BY rule_number
+            ) c
+            WHERE r.rule_number = c.rule_number;
+        """)
+        updated = self.cursor.rowcount
+        self.conn.commit()
+        print(f"   ✓ {updated} rule centroids stored")
+    
+    def list_versions(self) -> List[str]:
+        """Retained previous live schemas, newest first"""
+        self.cursor.execute("""
+            SELECT nspname FROM pg_namespace
+            WHERE nspname LIKE %s
+            ORDER BY nspname DESC;
+        """, (VERSION_PREFIX.replace('_', '\\_') + '%',))
+        versions = [row['nspname'] for row in self.cursor.fetchall()]
+        self.conn.commit()
+        return versions
+    
+    def is_searchable_version(self, version: str) -> bool:
+        """Whether a retained schema has every table and column Q&A searches"""
+        self.cursor.execute("""
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = %s;
+        """, (version,))
+        columns = {(row['table_name'], row['column_name']) for row in self.cursor.fetchall()}
+        self.conn.commit()
+        return all(required in columns for required in SEARCHABLE_COLUMNS)
+    
+    def swap_live_schema(self, incoming: str, incoming_version: str) -> Optional[int]:
+        """
+        Make schema incoming the live schema in a single transaction
+        
+        The current live schema is renamed to its own version name, incoming is
+        renamed to LIVE_SCHEMA and the corpus generation is bumped, all in one
+        commit: Q&A sessions see either the old corpus or the new one, never a mix.
+        Returns the new corpus generation, or None if the swap was rolled back.
+        """
+        try:
+            self.cursor.execute("SELECT live_version FROM public.corpus_meta WHERE id;")
+            row = self.cursor.fetchone()
+            self.cursor.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s;", (LIVE_SCHEMA,))
+            if self.cursor.fetchone():
+                # A live schema without a recorded version sorts as the oldest
+                retired = (row and row['live_version']) or LEGACY_VERSION
+                self.cursor.execute(f"ALTER SCHEMA {LIVE_SCHEMA} RENAME TO {retired};")
+                print(f"   ✓ {LIVE_SCHEMA} retired as {retired}")
+            else:
+                self.retire_legacy_tables()
+            
+            self.cursor.execute(f"ALTER SCHEMA {incoming} RENAME TO {LIVE_SCHEMA};")
+            self.cursor.execute("""
+                UPDATE public.corpus_meta
+                SET generation = generation + 1, live_version = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id
+                RETURNING generation;
+            """, (incoming_version,))
+            generation = self.cursor.fetchone()['generation']
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"   ✗ Swap failed, live schema unchanged: {e}")
+            return None
+        
+        self.cursor.execute(f"SET search_path TO {LIVE_SCHEMA}, public;")
+        self.conn.commit()
+        print(f"   ✓ {incoming_version} is live (corpus generation {generation})")
+        return generation
+    
+    def retire_legacy_tables(self):
+        """
+        Move corpus tables left in public by runs before blue/green reindexing
+        into the LEGACY_VERSION schema (called inside the first swap)
+        
+        Q&A resolves tables through search_path finra_live, public; leaving them
+        in public would let a table missing from the live schema (e.g.
+        embedding_projection after a build without PCA) resolve to stale data.
+        """
+        self.cursor.execute("""
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+              AND (
+                  c.relname = ANY(%s)
+                  OR c.oid IN (
+                      SELECT i.inhrelid
+                      FROM pg_inherits i
+                      JOIN pg_class parent ON parent.oid = i.inhparent
+                      JOIN pg_namespace pn ON pn.oid = parent.relnamespace
+                      WHERE pn.nspname = 'public' AND parent.relname = ANY(%s)
+                  )
+              );
+        """, (CORPUS_TABLES, CORPUS_TABLES))
+        tables = [row['relname'] for row in self.cursor.fetchall()]
+        if not tables:
+            return
+        
+        self.cursor.execute(f"CREATE SCHEMA {LEGACY_VERSION};")
+        for table in tables:
+            self.cursor.execute(f"ALTER TABLE public.{table} SET SCHEMA {LEGACY_VERSION};")
+        print(f"   ✓ {len(tables)} pre-blue/green tables moved from public to {LEGACY_VERSION}")
+    
+    def finalize_build(self):
+        """
+        Build the vector indexes and planner statistics of the shadow build
+        
+        Runs after every row is loaded, so ivfflat lists are sized from and
+        trained on the real data and the swapped-in corpus is fully indexed and analyzed.
+        """
+        print("\nCreating per-partition vector indexes...")
+        self.create_partition_vector_indexes('embedding')
+        
+        print("Analyzing build tables...")
+        # embedding_projection only exists when PCA was applied
+        self.cursor.execute("""
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = current_schema() AND table_name = ANY(%s);
+        """, (CORPUS_TABLES,))
+        for row in self.cursor.fetchall():
+            self.cursor.execute(f"ANALYZE {row['table_name']};")
+        self.conn.commit()
+        print("   ✓ Planner statistics collected")
+    
+    def publish_build(self) -> bool:
+        """Index and analyze the finished build, swap it in as the live schema, then prune old versions"""
+        print("\n" + "="*80)
+        print("PUBLISHING BUILD")
+        print("="*80)
+        
+        self.finalize_build()
+        if self.swap_live_schema(BUILD_SCHEMA, self.build_version) is None:
+            return False
+        self.prune_versions()
+        return True
+    
+    def rollback_to_version(self, version: Optional[str] = None) -> bool:
+        """
+        Make a retained version live again (defaults to the most recent one Q&A
+        can search)
+        
+        The schema being replaced is itself retained, so a rollback can be undone
+        the same way. Versions with an older table layout, such as the
+        pre-blue/green tables in LEGACY_VERSION, are refused.
+        """
+        retained = self.list_versions()
+        versions = [v for v in retained if self.is_searchable_version(v)]
+        target = version or (versions[0] if versions else None)
+        if target in retained and target not in versions:
+            print(f"✗ {target} has an older table layout that Q&A cannot search")
+            return False
+        if target not in versions:
+            print(f"✗ No retained version {target or ''} (available: {', '.join(versions) or 'none'})")
+            return False
+        
+        print(f"\nRolling back to {target}...")
+        return self.swap_live_schema(target, target) is not None
+    
+    def prune_versions(self, keep: Optional[int] = None):
+        """Drop retained versions beyond the newest keep (default keep_versions)"""
+        keep = self.keep_versions if keep is None else keep
+        for version in self.list_versions()[keep:]:
+            self.cursor.execute(f"DROP SCHEMA {version} CASCADE;")
+            self.conn.commit()
+            print(f"   ✓ Dropped old version {version}")
+    
     def generate_embedding(self, text: str) -> List[float]:
         """Generate vector embedding for text"""
         if not text or text.strip() == "":
@@ -192,8 +570,10 @@ class S3PostgresVectorParser:
         print(f"\n✓ Rule {rule_number}: {rule_title}")
         
         if self.insert_rule(rule_number, rule_title):
-            self.parse_sections(content, rule_number)
-            self.parse_supplementary_materials(content, rule_number)
+            document_id = self.insert_document(rule_number, file_name, content)
+            if document_id is not None:
+                self.parse_sections(content, rule_number, document_id)
+                self.parse_supplementary_materials(content, rule_number, document_id)
         
         print(f"\n✓ Rule {rule_number} complete!\n")
     
@@ -201,11 +581,11 @@ class S3PostgresVectorParser:
         """Insert or update a rule - rule_number is PK"""
         try:
             self.cursor.execute("""
-                INSERT INTO rules (rule_number, title)
-                VALUES (%s, %s)
+                INSERT INTO rules (rule_number, rule_series, title)
+                VALUES (%s, %s, %s)
                 ON CONFLICT (rule_number) DO UPDATE 
                 SET title = EXCLUDED.title, updated_at = CURRENT_TIMESTAMP;
-            """, (rule_number, title))
+            """, (rule_number, rule_series(rule_number), title))
             
             self.conn.commit()
             print(f"  ✓ Inserted Rule {rule_number}")
@@ -215,6 +595,34 @@ class S3PostgresVectorParser:
             print(f"  ✗ Error inserting rule: {e}")
             return False
     
+    def insert_document(self, rule_number: str, source_key: str, content: str) -> Optional[int]:
+        """Store the full source text once; sections and materials reference it by offset"""
+        try:
+            self.cursor.execute("""
+                INSERT INTO documents (rule_number, source_key, content)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (rule_number) DO UPDATE
+                SET source_key = EXCLUDED.source_key, content = EXCLUDED.content
+                RETURNING id;
+            """, (rule_number, source_key, content))
+            
+            document_id = self.cursor.fetchone()['id']
+            self.conn.commit()
+            print(f"  ✓ Stored document ({len(content)} chars)")
+            return document_id
+        except Exception as e:
+            self.conn.rollback()
+            print(f"  ✗ Error inserting document: {e}")
+            return None
+    
+    def strip_span(self, content: str, start: int, end: int) -> Tuple[int, int]:
+        """Offsets of content[start:end].strip() without building the slice"""
+        while start < end and content[start].isspace():
+            start += 1
+        while end > start and content[end - 1].isspace():
+            end -= 1
+        return start, end
+    
     def find_supplementary_start(self, content: str) -> Optional[int]:
         """Find where supplementary material starts"""
         supp_patterns = [
@@ -256,21 +664,84 @@ class S3PostgresVectorParser:
         roman_pattern = r'^(i|ii|iii|iv|v|vi|vii|viii|ix|x|xi|xii|xiii|xiv|xv|xvi|xvii|xviii|xix|xx)$'
         return re.match(roman_pattern, label.lower()) is not None
     
-    def parse_sections(self, content: str, rule_number: str):
-        """Parse sections with flexible # pattern - captures FULL content"""
+    def extract_citations(self, text: str, rule_number: str, start: int = 0,
+                          end: Optional[int] = None) -> List[Tuple[str, Optional[str]]]:
+        """
+        Extract (to_rule, to_label) citations from section text
+        
+        "Rule 2111(a)" -> ('2111', 'a'), "Rule 3110" -> ('3110', None),
+        "paragraph (b)" -> (rule_number, 'b'), "paragraphs (a) through (c)" -> a, b
+        and c. Only the top-level label is kept, matching how sections are
+        stored. start/end limit the scan to one section of a larger document.
+        """
+        citations = set()
+        end = len(text) if end is None else end
+        
+        for match in PARAGRAPH_REFERENCE_PATTERN.finditer(text, start, end):
+            target_rule = match.group(1) or rule_number
+            previous = None
+            # Only the first parenthesis of each reference is a section label
+            for through, label in re.findall(r'(?:^|[\s,])(through\s+)?\(([a-z])\)',
+                                             match.group(0).split(None, 1)[1]):
+                # "(a) through (c)" also cites every label in between
+                if through and previous and previous < label:
+                    for between in range(ord(previous) + 1, ord(label)):
+                        citations.add((target_rule, chr(between)))
+                citations.add((target_rule, label))
+                previous = label
+        
+        for match in RULE_REFERENCE_PATTERN.finditer(text, start, end):
+            for target_rule, label in re.findall(r'(\d{4})(?:\(([a-z])\))?', match.group(0)):
+                citations.add((target_rule, label or None))
+        
+        # A whole-rule edge adds nothing when a labeled edge to the same rule exists
+        labeled_rules = {r for r, label in citations if label}
+        return sorted(
+            (r, label) for r, label in citations
+            if (label or r not in labeled_rules)
+        )
+    
+    def insert_citations(self, rule_number: str, from_kind: str, from_label: str,
+                         document: str, start: int, end: int) -> int:
+        """Insert citation edges for one section or supplementary material"""
+        try:
+            citations = [
+                (to_rule, to_label) for to_rule, to_label in self.extract_citations(document, rule_number, start, end)
+                if not (to_rule == rule_number and to_label == from_label)
+            ]
+            if not citations:
+                return 0
+            
+            for to_rule, to_label in citations:
+                self.cursor.execute("""
+                    INSERT INTO rule_citations (from_rule, from_kind, from_label, to_rule, to_label)
+                    VALUES (%s, %s, %s, %s, %s);
+                """, (rule_number, from_kind, from_label, to_rule, to_label))
+            self.conn.commit()
+            
+            targets = ', '.join(f"{r}({l})" if l else r for r, l in citations)
+            print(f"         ↳ cites {targets}")
+            return len(citations)
+        except Exception as e:
+            self.conn.rollback()
+            print(f"         ✗ Error inserting citations: {e}")
+            return 0
+    
+    def parse_sections(self, content: str, rule_number: str, document_id: int):
+        """Parse sections with flexible # pattern - records FULL content as offsets into the document"""
         print("\n  Parsing sections...")
         
         # Get main content boundaries
         start_pos, end_pos = self.find_content_boundaries(content)
-        main_content = content[start_pos:end_pos]
         
-        print(f"    Main content area: {start_pos} to {end_pos} ({len(main_content)} chars)")
+        print(f"    Main content area: {start_pos} to {end_pos} ({end_pos - start_pos} chars)")
         
         # FLEXIBLE PATTERN: Matches any number of # followed by (lowercase letter)
         # Examples: # (a), ## (a), ### (a), #### (a)
-        section_pattern = r'^#{1,}\s*\(([a-z])\)'
+        section_pattern = re.compile(r'^#{1,}\s*\(([a-z])\)', re.MULTILINE)
         
-        matches = list(re.finditer(section_pattern, main_content, re.MULTILINE))
+        # Search inside the main area by position instead of slicing it out
+        matches = list(section_pattern.finditer(content, start_pos, end_pos))
         
         # Filter out Roman numerals
         sections = []
@@ -285,67 +756,129 @@ class S3PostgresVectorParser:
         
         if not sections:
             print("    No labeled sections found - creating section with '-'")
-            section_content = main_content.strip()
-            if section_content:
-                self.insert_section(rule_number, '-', section_content)
+            section_start, section_end = self.strip_span(content, start_pos, end_pos)
+            if section_end > section_start:
+                self.insert_section(rule_number, '-', document_id, content, section_start, section_end)
             return
         
         print(f"    Found {len(sections)} labeled sections: {[s['label'] for s in sections]}")
         
-        # Extract FULL content for each section
+        # Record FULL content span for each section
         for i, section in enumerate(sections):
             label = section['label']
-            content_start = section['end']
             
-            # Find where this section ends (start of next section or end of main_content)
-            if i + 1 < len(sections):
-                content_end = sections[i + 1]['start']
-            else:
-                content_end = len(main_content)
-            
-            # Extract the section title and content
-            section_content = main_content[content_start:content_end].strip()
+            # Section ends at the start of the next section or the end of the main area
+            content_end = sections[i + 1]['start'] if i + 1 < len(sections) else end_pos
+            section_start, section_end = self.strip_span(content, section['end'], content_end)
             
-            if section_content:
-                # Extract title (first line after the label)
-                lines = section_content.split('\n', 1)
-                if lines:
-                    title = lines[0].strip()
-                    body = lines[1].strip() if len(lines) > 1 else ''
-                    
-                    # Combine title and body
-                    full_content = f"{title}\n\n{body}".strip() if body else title
-                    
-                    self.insert_section(rule_number, label, full_content)
-    
-    def insert_section(self, rule_number: str, section_label: str, content: str) -> Optional[int]:
-        """Insert a section with embedding"""
+            if section_end > section_start:
+                self.insert_section(rule_number, label, document_id, content, section_start, section_end)
+    
+    def find_near_duplicate(self, key: Tuple[str, str, str, str], document: str, start: int, end: int):
+        """
+        Look up an already embedded near-duplicate of document[start:end]
+        
+        key is the row's (kind, rule_series, rule_number, label). It is never
+        matched against itself, so re-ingesting a rule does not turn its rows
+        into duplicates of their own earlier version.
+        Returns (signature, (kind, series, id, similarity) or None). The
+        signature is None when deduplication is disabled.
+        """
+        if self.near_duplicates is None:
+            return None, None
+        signature = self.near_duplicates.signature(document, start, end)
+        match = self.near_duplicates.query(signature, exclude=key)
+        if match is None:
+            return signature, None
+        representative_key, similarity = match
+        kind, series = representative_key[0], representative_key[1]
+        return signature, (kind, series, self.embedded_rows[representative_key], similarity)
+    
+    def record_embedding(self, key: Tuple[str, str, str, str], row_id: int, signature, representative):
+        """Register a new representative, or link an occurrence to its representative"""
+        kind, series = key[0], key[1]
+        # A re-ingested row replaces whatever it was linked to before
+        self.cursor.execute("""
+            DELETE FROM near_duplicates WHERE duplicate_kind = %s AND duplicate_id = %s;
+        """, (kind, row_id))
+        
+        if representative is None:
+            self.embedding_stats['embedded'] += 1
+            if signature is not None:
+                self.near_duplicates.insert(key, signature)
+                self.embedded_rows[key] = row_id
+            return
+        
+        if self.near_duplicates is not None:
+            self.near_duplicates.remove(key)
+            self.embedded_rows.pop(key, None)
+        
+        representative_kind, representative_series, representative_id, similarity = representative
+        # A re-ingested representative that is now a duplicate itself loses its
+        # embedding; the rows that shared it follow it to its new representative
+        self.cursor.execute("""
+            UPDATE near_duplicates
+            SET representative_kind = %s, representative_series = %s, representative_id = %s
+            WHERE representative_kind = %s AND representative_series = %s AND representative_id = %s;
+        """, (representative_kind, representative_series, representative_id, kind, series, row_id))
+        self.embedding_stats['reused'] += 1
+        self.cursor.execute("""
+            INSERT INTO near_duplicates (representative_kind, representative_series, representative_id,
+                                         duplicate_kind, duplicate_series, duplicate_id, similarity)
+            VALUES (%s, %s, %s, %s, %s, %s, %s);
+        """, (representative_kind, representative_series, representative_id, kind, series, row_id, similarity))
+        print(f"         ↳ near-duplicate of {representative_kind} #{representative_id} "
+              f"(~{similarity:.2f} Jaccard) - embedding skipped")
+    
+    def report_embedding_savings(self):
+        """Print how much embedding work near-duplicate detection saved"""
+        embedded = self.embedding_stats['embedded']
+        reused = self.embedding_stats['reused']
+        total = embedded + reused
+        if not total:
+            return
+        print(f"\nEmbeddings: {embedded} computed, {reused} near-duplicates reused "
+              f"({reused / total * 100:.1f}% of model calls saved)")
+    
+    def insert_section(self, rule_number: str, section_label: str, document_id: int,
+                       document: str, start: int, end: int) -> Optional[int]:
+        """Insert a section (offsets into its document) with embedding"""
         try:
-            # Generate embedding from content
-            embedding = self.generate_embedding(content)
+            # Near-duplicates reuse their representative's embedding (stored as NULL)
+            key = ('section', rule_series(rule_number), rule_number, section_label)
+            signature, representative = self.find_near_duplicate(key, document, start, end)
+            
+            # Embedding only needs the first 1000 chars of the section
+            embedding = None
+            if representative is None:
+                embedding = self.generate_embedding(document[start:min(end, start + 1000)])
             
             self.cursor.execute("""
-                INSERT INTO sections (rule_number, section_label, content, embedding)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (rule_number, section_label) DO UPDATE
-                SET content = EXCLUDED.content, embedding = EXCLUDED.embedding
+                INSERT INTO sections (rule_number, rule_series, section_label, document_id, start_offset, end_offset, embedding)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (rule_series, rule_number, section_label) DO UPDATE
+                SET document_id = EXCLUDED.document_id, start_offset = EXCLUDED.start_offset,
+                    end_offset = EXCLUDED.end_offset, embedding = EXCLUDED.embedding
                 RETURNING id;
-            """, (rule_number, section_label, content, embedding))
+            """, (rule_number, rule_series(rule_number), section_label, document_id, start, end, embedding))
             
             section_id = self.cursor.fetchone()['id']
+            self.record_embedding(key, section_id, signature, representative)
             self.conn.commit()
             
-            preview = content[:100].replace('\n', ' ')
-            print(f"      ✓ ({section_label}) {len(content)} chars")
+            preview = document[start:min(end, start + 100)].replace('\n', ' ')
+            print(f"      ✓ ({section_label}) {end - start} chars @ {start}-{end}")
             print(f"         {preview}...")
+            
+            self.insert_citations(rule_number, 'section', section_label, document, start, end)
             return section_id
         except Exception as e:
             self.conn.rollback()
             print(f"      ✗ Error inserting section ({section_label}): {e}")
             return None
     
-    def parse_supplementary_materials(self, content: str, rule_number: str):
-        """Parse supplementary materials (.01, .02, .03, etc.)"""
+    def parse_supplementary_materials(self, content: str, rule_number: str, document_id: int):
+        """Parse supplementary materials (.01, .02, .03, etc.) as offsets into the document"""
         print("\n  Parsing supplementary materials...")
         
         # Find supplementary section START
@@ -371,21 +904,21 @@ class S3PostgresVectorParser:
         end_markers = [r'Amended by SR-FINRA', r'Selected Notices?:', r'^VERSIONS', r'^Disclaimer:', r'^\[']
         supp_end = len(content)
         for marker in end_markers:
-            match = re.search(marker, content[supp_start:], re.IGNORECASE | re.MULTILINE)
-            if match and (supp_start + match.start()) < supp_end:
-                supp_end = supp_start + match.start()
+            match = re.compile(marker, re.IGNORECASE | re.MULTILINE).search(content, supp_start)
+            if match and match.start() < supp_end:
+                supp_end = match.start()
         
-        supp_content = content[supp_start:supp_end].strip()
+        supp_start, supp_end = self.strip_span(content, supp_start, supp_end)
         
-        print(f"    Supplementary area: {supp_start} to {supp_end} ({len(supp_content)} chars)")
+        print(f"    Supplementary area: {supp_start} to {supp_end} ({supp_end - supp_start} chars)")
         
-        if not supp_content:
+        if supp_end <= supp_start:
             print("    Supplementary section is empty")
             return
         
         # Pattern: .01 Title, .02 Title
-        material_pattern = r'\.(\d{2})\s+([A-Z][^\n.]+?)\.(?:\s|$)'
-        materials = list(re.finditer(material_pattern, supp_content))
+        material_pattern = re.compile(r'\.(\d{2})\s+([A-Z][^\n.]+?)\.(?:\s|$)')
+        materials = list(material_pattern.finditer(content, supp_start, supp_end))
         
         if not materials:
             print("    No numbered supplementary materials found")
@@ -398,34 +931,43 @@ class S3PostgresVectorParser:
             material_title = match.group(2).strip()
             material_title = re.sub(r'\*\*', '', material_title).strip()
             
-            content_start = match.end()
-            content_end = materials[i + 1].start() if i + 1 < len(materials) else len(supp_content)
+            content_end = materials[i + 1].start() if i + 1 < len(materials) else supp_end
+            material_start, material_end = self.strip_span(content, match.end(), content_end)
             
-            material_content = supp_content[content_start:content_end].strip()
-            
-            if material_content:
-                self.insert_supplementary_material(rule_number, material_number, material_title, material_content)
+            if material_end > material_start:
+                self.insert_supplementary_material(rule_number, material_number, material_title,
+                                                   document_id, content, material_start, material_end)
     
-    def insert_supplementary_material(self, rule_number: str, material_number: str, title: str, content: str) -> Optional[int]:
-        """Insert supplementary material with embedding"""
+    def insert_supplementary_material(self, rule_number: str, material_number: str, title: str,
+                                      document_id: int, document: str, start: int, end: int) -> Optional[int]:
+        """Insert supplementary material (offsets into its document) with embedding"""
         try:
-            embed_text = f"{title}. {content}"
-            embedding = self.generate_embedding(embed_text)
+            key = ('supplementary', rule_series(rule_number), rule_number, material_number)
+            signature, representative = self.find_near_duplicate(key, document, start, end)
+            
+            embedding = None
+            if representative is None:
+                embed_text = f"{title}. {document[start:min(end, start + 1000)]}"
+                embedding = self.generate_embedding(embed_text)
             
             self.cursor.execute("""
-                INSERT INTO supplementary_materials (rule_number, material_number, title, content, embedding)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (rule_number, material_number) DO UPDATE
-                SET title = EXCLUDED.title, content = EXCLUDED.content, embedding = EXCLUDED.embedding
+                INSERT INTO supplementary_materials (rule_number, rule_series, material_number, title, document_id, start_offset, end_offset, embedding)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (rule_series, rule_number, material_number) DO UPDATE
+                SET title = EXCLUDED.title, document_id = EXCLUDED.document_id, start_offset = EXCLUDED.start_offset,
+                    end_offset = EXCLUDED.end_offset, embedding = EXCLUDED.embedding
                 RETURNING id;
-            """, (rule_number, material_number, title, content, embedding))
+            """, (rule_number, rule_series(rule_number), material_number, title, document_id, start, end, embedding))
             
             material_id = self.cursor.fetchone()['id']
+            self.record_embedding(key, material_id, signature, representative)
             self.conn.commit()
             
-            preview = content[:60].replace('\n', ' ')
+            preview = document[start:min(end, start + 60)].replace('\n', ' ')
             print(f"      ✓ .{material_number}: {title[:30]}")
-            print(f"         {len(content)} chars | {preview}...")
+            print(f"         {end - start} chars @ {start}-{end} | {preview}...")
+            
+            self.insert_citations(rule_number, 'supplementary', material_number, document, start, end)
             return material_id
         except Exception as e:
             self.conn.rollback()
@@ -448,10 +990,183 @@ class S3PostgresVectorParser:
             if content:
                 self.parse_markdown_content(content, file_key)
         
+        self.report_embedding_savings()
+        self.compute_rule_centroids()
+        
         print("\n" + "="*80)
         print("ALL FILES PROCESSED!")
         print("="*80)
     
+    def process_ecfr_source(self, source: str):
+        """
+        Ingest an eCFR bulk XML title (local path or s3://bucket/key)
+        
+        Streams the XML section by section - no PDF conversion and no markdown
+        parsing - and writes through the same insert_rule/insert_section path.
+        """
+        if source.startswith('s3://'):
+            bucket, _, key = source[5:].partition('/')
+            print(f"Streaming s3://{bucket}/{key}")
+            xml_input = self.s3_client.get_object(Bucket=bucket, Key=key)['Body']
+        else:
+            print(f"Streaming {source}")
+            xml_input = source
+        
+        reader = ECFRXMLReader(xml_input)
+        current_part = None
+        section_count = 0
+        
+        for cfr_section in reader.iter_sections():
+            if cfr_section['part_number'] != current_part:
+                current_part = cfr_section['part_number']
+                print("\n" + "=" * 80)
+                print(f"PART {current_part}: {cfr_section['part_title'] or ''}")
+                print("=" * 80)
+            
+            rule_number = cfr_section['rule_number']
+            print(f"\n✓ § {rule_number}: {cfr_section['title']}")
+            
+            if self.insert_rule(rule_number, cfr_section['title']):
+                document = cfr_section['text']
+                document_id = self.insert_document(rule_number, f"{source}#{rule_number}", document)
+                if document_id is None:
+                    continue
+                for label, start, end in cfr_section['sections']:
+                    self.insert_section(rule_number, label, document_id, document, start, end)
+                    section_count += 1
+        
+        self.report_embedding_savings()
+        self.compute_rule_centroids()
+        
+        print("\n" + "="*80)
+        print(f"eCFR INGEST COMPLETE: {reader.sections_read} CFR sections, {section_count} paragraphs")
+        print("="*80)
+    
+    def apply_pca_projection(self, target_dim: int = 128, recall_k: int = 10, sample_size: int = 200):
+        """
+        Reduced-dimension mode: fit PCA over every stored embedding and add
+        an embedding_reduced column searched by the Q&A engine
+        
+        The projection (mean + components) is stored in embedding_projection so
+        queries are projected the same way. Prints explained variance and
+        recall@k of reduced-vs-full search for title pseudo-queries.
+        """
+        print("\n" + "="*80)
+        print(f"PCA PROJECTION ({target_dim} dims)")
+        print("="*80)
+        
+        self.cursor.execute("""
+            SELECT 'sections' as source, s.rule_series, s.id, s.embedding::text as embedding,
+                   substr(d.content, s.start_offset + 1, LEAST(s.end_offset - s.start_offset, 200)) as content
+            FROM sections s
+            JOIN documents d ON d.id = s.document_id
+            WHERE s.embedding IS NOT NULL
+            UNION ALL
+            SELECT 'supplementary_materials', sm.rule_series, sm.id, sm.embedding::text,
+                   substr(d.content, sm.start_offset + 1, LEAST(sm.end_offset - sm.start_offset, 200))
+            FROM supplementary_materials sm
+            JOIN documents d ON d.id = sm.document_id
+            WHERE sm.embedding IS NOT NULL;
+        """)
+        rows = self.cursor.fetchall()
+        if not rows:
+            print("No embeddings to project")
+            return
+        
+        matrix = np.array([json.loads(row['embedding']) for row in rows], dtype=np.float64)
+        mean = matrix.mean(axis=0)
+        _, singular_values, components = np.linalg.svd(matrix - mean, full_matrices=False)
+        
+        target_dim = min(target_dim, components.shape[0])
+        variance = singular_values ** 2
+        explained = float(variance[:target_dim].sum() / variance.sum())
+        print(f"\n  Fitted on {len(rows)} embeddings: {matrix.shape[1]} -> {target_dim} dims")
+        print(f"  Explained variance: {explained * 100:.1f}%")
+        
+        self.report_pca_recall(rows, matrix, mean, components, target_dim, recall_k, sample_size)
+        
+        print("\n  Storing projection matrix...")
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_projection (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                source_dim INTEGER NOT NULL,
+                target_dim INTEGER NOT NULL,
+                mean DOUBLE PRECISION[] NOT NULL,
+                components DOUBLE PRECISION[] NOT NULL,
+                explained_variance DOUBLE PRECISION NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        self.cursor.execute("""
+            INSERT INTO embedding_projection (id, source_dim, target_dim, mean, components, explained_variance)
+            VALUES (TRUE, %s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE
+            SET source_dim = EXCLUDED.source_dim, target_dim = EXCLUDED.target_dim,
+                mean = EXCLUDED.mean, components = EXCLUDED.components,
+                explained_variance = EXCLUDED.explained_variance, created_at = CURRENT_TIMESTAMP;
+        """, (matrix.shape[1], target_dim, mean.tolist(), components[:target_dim].tolist(), explained))
+        
+        print("  Writing reduced vectors...")
+        reduced = (matrix - mean) @ components[:target_dim].T
+        for table in ['sections', 'supplementary_materials']:
+            # Re-created so a different target_dim replaces the old column and its indexes
+            self.cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS embedding_reduced;")
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN embedding_reduced vector({target_dim});")
+            execute_batch(self.cursor, f"""
+                UPDATE {table} SET embedding_reduced = %s::vector
+                WHERE rule_series = %s AND id = %s;
+            """, [
+                (vector.tolist(), row['rule_series'], row['id'])
+                for row, vector in zip(rows, reduced) if row['source'] == table
+            ])
+        self.conn.commit()
+        
+        print("  Creating reduced vector indexes...")
+        self.create_partition_vector_indexes('embedding_reduced')
+        
+        self.cursor.execute("ALTER TABLE rules DROP COLUMN IF EXISTS embedding_reduced;")
+        self.cursor.execute(f"ALTER TABLE rules ADD COLUMN embedding_reduced vector({target_dim});")
+        self.compute_rule_centroids('embedding_reduced')
+        
+        print(f"\n✓ Reduced-dimension mode enabled ({target_dim} dims)")
+        print("="*80 + "\n")
+    
+    def report_pca_recall(self, rows: List[Dict], matrix: np.ndarray, mean: np.ndarray,
+                          components: np.ndarray, target_dim: int, recall_k: int, sample_size: int):
+        """Print recall@k of reduced-dimension search against full-dimension search"""
+        titles = []
+        for row in rows:
+            title = re.sub(r'[*#_]', '', row['content'].split('\n', 1)[0]).strip()
+            if len(title) > 10:
+                titles.append(title[:200])
+        titles = sorted(set(titles))
+        if not titles:
+            return
+        if len(titles) > sample_size:
+            rng = np.random.default_rng(42)
+            titles = [titles[i] for i in sorted(rng.choice(len(titles), sample_size, replace=False))]
+        
+        def normalize(vectors):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return vectors / norms
+        
+        queries = self.embedding_model.encode(titles, convert_to_numpy=True).astype(np.float64)
+        k = min(recall_k, len(rows))
+        full_top = np.argpartition(-(normalize(queries) @ normalize(matrix).T), k - 1, axis=1)[:, :k]
+        
+        print(f"\n  Recall@{k} vs full {matrix.shape[1]}-dim search ({len(titles)} title queries):")
+        for dim in sorted({max(1, target_dim // 2), target_dim, min(target_dim * 2, components.shape[0])}):
+            projection = components[:dim].T
+            reduced_rows = normalize((matrix - mean) @ projection)
+            reduced_queries = normalize((queries - mean) @ projection)
+            reduced_top = np.argpartition(-(reduced_queries @ reduced_rows.T), k - 1, axis=1)[:, :k]
+            recall = np.mean([
+                len(set(full) & set(red)) / k for full, red in zip(full_top, reduced_top)
+            ])
+            marker = "  <- selected" if dim == target_dim else ""
+            print(f"    {dim:>4} dims: {recall:.3f}{marker}")
+    
     def get_statistics(self):
         """Get database statistics"""
         print("\n" + "=" * 80)
@@ -467,6 +1182,9 @@ class S3PostgresVectorParser:
         self.cursor.execute("SELECT COUNT(*) as count FROM supplementary_materials;")
         print(f"Supplementary Materials (with embeddings): {self.cursor.fetchone()['count']}")
         
+        self.cursor.execute("SELECT COUNT(*) as count FROM near_duplicates;")
+        print(f"Near-duplicate occurrences (sharing a representative's embedding): {self.cursor.fetchone()['count']}")
+        
         print("\n" + "-" * 80)
         print("SAMPLE STRUCTURES:")
         print("-" * 80)
@@ -499,8 +1217,11 @@ class S3PostgresVectorParser:
             print(f"\nRule: {rule['rule_number']} - {rule['title']}")
             
             self.cursor.execute("""
-                SELECT section_label, LENGTH(content) as len, LEFT(content, 150) as preview
-                FROM sections WHERE rule_number = %s ORDER BY section_label;
+                SELECT s.section_label, s.end_offset - s.start_offset as len,
+                       substr(d.content, s.start_offset + 1, LEAST(s.end_offset - s.start_offset, 150)) as preview
+                FROM sections s
+                JOIN documents d ON d.id = s.document_id
+                WHERE s.rule_number = %s ORDER BY s.section_label;
             """, (rule['rule_number'],))
             
             print("\n  Sections:")
@@ -509,7 +1230,7 @@ class S3PostgresVectorParser:
                 print(f"       {s['preview']}...")
             
             self.cursor.execute("""
-                SELECT material_number, title, LENGTH(content) as len
+                SELECT material_number, title, end_offset - start_offset as len
                 FROM supplementary_materials WHERE rule_number = %s ORDER BY material_number;
             """, (rule['rule_number'],))
             
@@ -553,6 +1274,12 @@ def main():
         'port': int(input("Port [5432]: ").strip() or '5432')
     }
     
+    print("\nInput Source:")
+    source_type = input("Source - markdown or ecfr [markdown]: ").strip().lower() or 'markdown'
+    ecfr_source = None
+    if source_type == 'ecfr':
+        ecfr_source = input("eCFR XML path or s3://bucket/key: ").strip()
+    
     print("\nAWS S3 Configuration:")
     aws_config = {
         'bucket_name': input("Bucket name [tarannumpdf]: ").strip() or 'tarannumpdf',
@@ -562,9 +1289,20 @@ def main():
         'region_name': input("AWS Region [us-east-1]: ").strip() or 'us-east-1'
     }
     
+    print("\nEmbedding Configuration:")
+    reduced_dim = input("Reduced PCA dimension (blank keeps 384 only): ").strip()
+    keep_versions = int(input("Previous versions to keep for rollback [2]: ").strip() or '2')
+    
     try:
-        parser = S3PostgresVectorParser(pg_config, aws_config)
-        parser.process_all_files()
+        parser = S3PostgresVectorParser(pg_config, aws_config, keep_versions=keep_versions)
+        if ecfr_source:
+            parser.process_ecfr_source(ecfr_source)
+        else:
+            parser.process_all_files()
+        if reduced_dim:
+            parser.apply_pca_projection(int(reduced_dim))
+        if not parser.publish_build():
+            raise RuntimeError("Build finished but could not be published; previous corpus is still live")
         parser.get_statistics()
         parser.close()
         
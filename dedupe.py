@@ -0,0 +1,99 @@
+"""
+Near-Duplicate Detection - MinHash signatures + LSH banding
+Finds sections/materials whose text is nearly identical (boilerplate,
+disclaimers, standard cross-rule language) so only one copy is embedded.
+
+1. Text -> word 5-gram shingles -> 32-bit shingle hashes
+2. MinHash signature: min of (a*x + b) mod p over all shingles, per permutation
+3. LSH: signature split into bands; items sharing any band bucket are candidates
+4. Candidates are confirmed by estimated Jaccard similarity >= threshold
+"""
+
+import re
+import zlib
+from typing import Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+MERSENNE_PRIME = (1 << 31) - 1
+WORD_PATTERN = re.compile(r'[a-z0-9]+', re.IGNORECASE)
+
+
+class MinHashLSH:
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 5, seed: int = 1):
+        """
+        Args:
+            threshold: Minimum estimated Jaccard similarity to call two texts duplicates
+            num_perm: Signature length (number of hash permutations)
+            bands: LSH bands; num_perm must divide evenly into them
+            shingle_size: Words per shingle
+            seed: Permutation seed, fixed so runs are reproducible
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+        self.buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[Hashable, np.ndarray] = {}
+
+    def shingles(self, text: str, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Hashed word shingles of text[start:end]; short texts become a single shingle"""
+        end = len(text) if end is None else end
+        words = [word.lower() for word in WORD_PATTERN.findall(text, start, end)]
+        if len(words) < self.shingle_size:
+            grams = {' '.join(words)}
+        else:
+            grams = {
+                ' '.join(words[i:i + self.shingle_size])
+                for i in range(len(words) - self.shingle_size + 1)
+            }
+        return np.array([zlib.crc32(g.encode('utf-8')) for g in grams], dtype=np.uint64)
+
+    def signature(self, text: str, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """MinHash signature of text[start:end] (scanned in place, no slice)"""
+        hashed = self.shingles(text, start, end) % np.uint64(MERSENNE_PRIME)
+        # (num_perm x 1) * (1 x n_shingles) stays below 2^62, no uint64 overflow
+        return ((self.a * hashed[np.newaxis, :] + self.b) % np.uint64(MERSENNE_PRIME)).min(axis=1)
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """One bucket key per band"""
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature: np.ndarray, exclude: Optional[Hashable] = None) -> Optional[Tuple[Hashable, float]]:
+        """Best indexed (key, estimated Jaccard) at or above threshold, else None; never exclude itself"""
+        candidates = set()
+        for band, key in enumerate(self.band_keys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+        candidates.discard(exclude)
+
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def insert(self, key: Hashable, signature: np.ndarray):
+        """Index a representative's signature, replacing any earlier one under the same key"""
+        self.remove(key)
+        self.signatures[key] = signature
+        for band, band_key in enumerate(self.band_keys(signature)):
+            self.buckets[band].setdefault(band_key, []).append(key)
+
+    def remove(self, key: Hashable):
+        """Drop a key from the index (no-op if absent)"""
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in enumerate(self.band_keys(signature)):
+            bucket = self.buckets[band].get(band_key, [])
+            if key in bucket:
+                bucket.remove(key)
@@ -0,0 +1,150 @@
+"""
+eCFR Bulk XML Reader - streaming source for CFR rules
+Reads eCFR title XML (govinfo bulk data or the eCFR versioner API) with
+incremental iterparse and yields one CFR section at a time.
+
+Mapping onto the rules/sections schema:
+1. PART (DIV5) -> carried as context; its number prefixes every rule_number
+2. SECTION (DIV8) -> one rule, e.g. rule_number '240.10b-5'
+3. Paragraphs (a), (b), ... -> one section row per top-level label;
+   nested (1), (i), (A) paragraphs are folded into their parent
+4. Text before the first label (or a section without labels) -> label '-'
+5. The section text (heading + paragraphs) is the stored document; section
+   rows are (start, end) offsets into it
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SECTION_NUMBER_PATTERN = re.compile(r'^§+\s*([\w.\-]+)\s*(.*)$')
+PARAGRAPH_LABEL_PATTERN = re.compile(r'^\(([a-z]{1,2}|\d+|[A-Z])\)')
+
+
+class ECFRXMLReader:
+    def __init__(self, source):
+        """
+        Args:
+            source: Path or binary file object (e.g. an S3 StreamingBody)
+        """
+        self.source = source
+        self.sections_read = 0
+
+    @staticmethod
+    def element_text(element) -> str:
+        """All text inside an element (<I>, <E>, <SU> children included), whitespace collapsed"""
+        return re.sub(r'\s+', ' ', ''.join(element.itertext())).strip()
+
+    @staticmethod
+    def is_next_top_label(label: str, current: Optional[str]) -> bool:
+        """
+        True if label starts a new top-level paragraph
+
+        (i) after (h) is a letter, but (i) under (a)(1) is a roman numeral;
+        only the letter that follows the current top label counts as top-level.
+        """
+        if not re.match(r'^[a-z]$', label):
+            return False
+        if current is None or current == '-':
+            return label == 'a'
+        return ord(label) == ord(current) + 1
+
+    def group_paragraphs(self, paragraphs: List[str], offset: int = 0) -> List[Tuple[str, int, int]]:
+        """
+        Group paragraphs into (top-level label, start, end) spans
+
+        Offsets assume the paragraphs are joined with a blank line, starting
+        at offset in the document.
+        """
+        groups = []
+        current_label = None
+        group_start = None
+        position = offset
+
+        for text in paragraphs:
+            match = PARAGRAPH_LABEL_PATTERN.match(text)
+            if match and self.is_next_top_label(match.group(1), current_label):
+                if group_start is not None:
+                    groups.append((current_label or '-', group_start, position - 2))
+                current_label = match.group(1)
+                group_start = position
+            elif group_start is None:
+                group_start = position
+            position += len(text) + 2
+
+        if group_start is not None:
+            groups.append((current_label or '-', group_start, position - 2))
+        return groups
+
+    def iter_sections(self) -> Iterator[Dict]:
+        """
+        Yield CFR sections in document order at constant memory
+
+        Every finished SECTION or PART element is detached from its parent,
+        so the partial tree never grows beyond the section being read.
+        """
+        open_elements = []
+        div_stack = []
+        part_number = None
+        part_title = None
+
+        for event, element in ET.iterparse(self.source, events=('start', 'end')):
+            if event == 'start':
+                open_elements.append(element)
+                if element.tag.startswith('DIV'):
+                    div_stack.append(element.get('TYPE', '').upper())
+                    if div_stack[-1] == 'PART':
+                        part_number = element.get('N')
+                        part_title = None
+                continue
+
+            open_elements.pop()
+            parent = open_elements[-1] if open_elements else None
+
+            if element.tag == 'HEAD' and div_stack and div_stack[-1] == 'PART':
+                part_title = self.element_text(element)
+
+            elif element.tag.startswith('DIV'):
+                div_type = div_stack.pop() if div_stack else ''
+
+                if div_type == 'SECTION':
+                    section = self.read_section(element, part_number, part_title)
+                    if section:
+                        self.sections_read += 1
+                        yield section
+
+                if div_type in ('SECTION', 'PART'):
+                    element.clear()
+                    if parent is not None:
+                        parent.remove(element)
+
+    def read_section(self, element, part_number: Optional[str], part_title: Optional[str]) -> Optional[Dict]:
+        """Convert one SECTION element into a rule dict; None for empty/reserved sections"""
+        head = element.find('HEAD')
+        heading = self.element_text(head) if head is not None else ''
+        match = SECTION_NUMBER_PATTERN.match(heading)
+
+        if match:
+            section_number, title = match.group(1).rstrip('.'), match.group(2).strip()
+        else:
+            section_number = (element.get('N') or '').replace('§', '').strip()
+            title = heading
+        if not section_number:
+            return None
+
+        paragraphs = [
+            self.element_text(child) for child in element
+            if child.tag in ('P', 'FP') and self.element_text(child)
+        ]
+        if not paragraphs:
+            return None
+
+        body_offset = len(heading) + 2
+        return {
+            'part_number': part_number,
+            'part_title': part_title,
+            'rule_number': section_number,
+            'title': title.rstrip('.') or heading,
+            'text': heading + '\n\n' + '\n\n'.join(paragraphs),
+            'sections': self.group_paragraphs(paragraphs, body_offset)
+        }
@@ -6,21 +6,169 @@ Answers questions by finding the most relevant rule sections using embeddings
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Union
+import re
+import time
 import numpy as np
 
+# Searchable kinds: table, alias and the columns returned for each hit
+SEARCH_TABLES = {
+    'section': ('sections', 's',
+                ['id', 'rule_number', 'section_label', 'document_id', 'start_offset', 'end_offset']),
+    'supplementary': ('supplementary_materials', 'sm',
+                      ['id', 'rule_number', 'material_number', 'title', 'document_id', 'start_offset', 'end_offset'])
+}
+
+def normalize_series(series: Union[str, int]) -> str:
+    """Normalize '2', 2, '2xxx' or '2000' to the partition key '2000'"""
+    value = str(series).strip().lower()
+    if value == 'other':
+        return value
+    match = re.match(r'^(\d)(?:000|xxx)?$', value)
+    if not match:
+        raise ValueError(f"Unknown rule series: {series}")
+    return f"{match.group(1)}000"
+
+
+class QueryResultCache:
+    """
+    In-memory cache of search_combined results
+    
+    Exact tier: keyed on normalized query text + search parameters.
+    Near-duplicate tier: reuses an entry whose query embedding has cosine
+    similarity >= similarity_threshold with the same search parameters.
+    Entries expire after ttl_seconds, the least recently used entry is evicted
+    past max_entries, and everything is dropped when the corpus generation changes.
+    """
+    
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        self.generation = None
+        self.stats = {'exact_hits': 0, 'near_hits': 0, 'misses': 0}
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Lowercase, collapse whitespace and drop trailing punctuation"""
+        return re.sub(r'\s+', ' ', query.lower()).strip().rstrip('?.!').strip()
+    
+    def set_generation(self, generation: Optional[int]):
+        """Drop every entry if the corpus generation moved"""
+        if generation != self.generation:
+            if self.entries:
+                print(f"  Corpus generation {self.generation} -> {generation}: clearing {len(self.entries)} cached results")
+            self.entries.clear()
+            self.generation = generation
+    
+    def expire(self):
+        """Remove entries older than ttl_seconds"""
+        cutoff = time.time() - self.ttl_seconds
+        for key in [k for k, entry in self.entries.items() if entry['created_at'] < cutoff]:
+            del self.entries[key]
+    
+    def get_exact(self, query: str, params: tuple) -> Optional[Dict]:
+        """Exact-text tier lookup"""
+        self.expire()
+        key = (self.normalize_query(query), params)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        self.stats['exact_hits'] += 1
+        return entry['results']
+    
+    def get_similar(self, embedding: List[float], params: tuple) -> Optional[Dict]:
+        """Near-duplicate tier lookup by cosine similarity of query embeddings"""
+        candidates = [(key, entry) for key, entry in self.entries.items() if key[1] == params]
+        if not candidates:
+            self.stats['misses'] += 1
+            return None
+        
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        matrix = np.stack([entry['embedding'] for _, entry in candidates])
+        similarities = matrix @ query_vector
+        best = int(np.argmax(similarities))
+        
+        if similarities[best] < self.similarity_threshold:
+            self.stats['misses'] += 1
+            return None
+        
+        key, entry = candidates[best]
+        self.entries.move_to_end(key)
+        self.stats['near_hits'] += 1
+        return entry['results']
+    
+    def put(self, query: str, params: tuple, embedding: List[float], results: Dict):
+        """Store results, evicting the least recently used entry if full"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = (self.normalize_query(query), params)
+        self.entries[key] = {
+            'embedding': vector,
+            'results': results,
+            'created_at': time.time()
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
 class FINRAQuestionAnswering:
-    def __init__(self, pg_config: dict):
-        """Initialize PostgreSQL connection and embedding model"""
+    def __init__(self, pg_config: dict, cache_size: int = 256, cache_ttl: float = 3600.0,
+                 cache_similarity: float = 0.95, generation_check_interval: float = 30.0,
+                 use_reduced: bool = True, coarse_rules: int = 5, coarse_margin: float = 0.02,
+                 ivfflat_probes: int = 10):
+        """
+        Initialize PostgreSQL connection, embedding model and result cache
+        
+        Args:
+            pg_config: psycopg2 connection parameters
+            cache_size: Maximum cached queries (0 disables the cache)
+            cache_ttl: Seconds a cached result stays valid
+            cache_similarity: Cosine threshold for the near-duplicate tier
+            generation_check_interval: Seconds between corpus generation checks
+            use_reduced: Search the PCA-reduced vectors when ingestion stored a projection
+            coarse_rules: Candidate rules picked by centroid before ranking sections (0 = global search)
+            coarse_margin: Rules scoring within this of the coarse_rules-th rule are
+                           candidates too; more than twice coarse_rules such rules
+                           is an ambiguous call and falls back to global search
+            ivfflat_probes: ivfflat lists scanned per partition index (pgvector's default of 1
+                            reads a single list and can return fewer than top_k rows)
+        """
         print("Connecting to PostgreSQL...")
         self.conn = psycopg2.connect(**pg_config)
+        # Each query is its own transaction, so a blue/green swap is picked up on
+        # the next query and no idle transaction holds locks on retired versions
+        self.conn.autocommit = True
         self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+        # Tables resolve to the live schema; databases built before blue/green
+        # reindexing have no finra_live and fall through to public
+        self.cursor.execute("SET search_path TO finra_live, public;")
+        self.cursor.execute("SET ivfflat.probes = %s;", (ivfflat_probes,))
         print("✓ Connected to PostgreSQL")
         
         print("\nLoading embedding model...")
         self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
         print("✓ Embedding model loaded")
         
+        self.cache = QueryResultCache(cache_size, cache_ttl, cache_similarity) if cache_size > 0 else None
+        self.generation_check_interval = generation_check_interval
+        self.last_generation_check = 0.0
+        self.set_corpus_generation(self.get_corpus_generation())
+        
+        self.use_reduced = use_reduced
+        self.projection = None
+        self.embedding_column = 'embedding'
+        self.load_projection()
+        
+        self.coarse_rules = coarse_rules
+        self.coarse_margin = coarse_margin
+        
         # Verify database has data
         self.cursor.execute("SELECT COUNT(*) as count FROM rules;")
         rule_count = self.cursor.fetchone()['count']
@@ -34,76 +182,598 @@ class FINRAQuestionAnswering:
         embedding = self.embedding_model.encode(text, convert_to_numpy=True)
         return embedding.tolist()
     
-    def search_sections(self, query: str, top_k: int = 5) -> List[Dict]:
+    def get_corpus_generation(self) -> Optional[int]:
+        """Read the corpus generation bumped by each ingestion run"""
+        try:
+            self.cursor.execute("SELECT generation FROM corpus_meta;")
+            row = self.cursor.fetchone()
+            return row['generation'] if row else None
+        except psycopg2.Error:
+            # Database built before corpus_meta existed - rely on TTL only
+            self.conn.rollback()
+            return None
+    
+    def set_corpus_generation(self, generation: Optional[int]):
+        """Record the corpus generation and how search statements read it back"""
+        self.corpus_generation = generation
+        # Every search statement also reads the generation it ran against
+        # (NULL on databases built before corpus_meta existed, until a publish creates it)
+        self.generation_probe = ("(SELECT generation FROM corpus_meta WHERE id)"
+                                 if generation is not None else "NULL::bigint")
+    
+    def refresh_corpus_generation(self):
+        """
+        Check the corpus generation at most once per generation_check_interval
+        before serving from the result cache. Searches do not rely on this:
+        run_search sees a swap on the very next statement.
+        """
+        now = time.time()
+        if now - self.last_generation_check < self.generation_check_interval:
+            return
+        self.last_generation_check = now
+        self.sync_corpus_generation()
+    
+    def sync_corpus_generation(self) -> bool:
+        """
+        Re-read the corpus generation; on change, reload the PCA projection and
+        clear the result cache. Returns True if the generation changed.
+        """
+        generation = self.get_corpus_generation()
+        changed = generation != self.corpus_generation
+        if changed:
+            print(f"Corpus generation {self.corpus_generation} -> {generation}: reloading projection")
+            self.set_corpus_generation(generation)
+            self.load_projection()
+        if self.cache is not None:
+            self.cache.set_generation(generation)
+        return changed
+    
+    def run_search(self, build_query) -> List[Dict]:
+        """
+        Run the (sql, params) returned by build_query() against the live corpus
+        
+        Each search statement returns the corpus generation it ran against as
+        corpus_generation. If a publish or rollback swapped the corpus since the
+        projection was loaded - seen as a different generation, or as an error
+        because the new corpus lacks the searched column - the projection is
+        reloaded and the query rebuilt and run once more.
+        """
+        for attempt in range(2):
+            sql, params = build_query()
+            try:
+                self.cursor.execute(sql, params)
+                rows = self.cursor.fetchall()
+            except psycopg2.Error:
+                if attempt == 0 and self.sync_corpus_generation():
+                    continue
+                raise
+            
+            if rows:
+                stale = rows[0]['corpus_generation'] != self.corpus_generation
+                if stale and attempt == 0:
+                    self.sync_corpus_generation()
+                    continue
+            elif attempt == 0 and self.sync_corpus_generation():
+                continue
+            break
+        
+        for row in rows:
+            row.pop('corpus_generation', None)
+        return rows
+    
+    def load_projection(self):
+        """Load the PCA projection stored by ingestion (reduced-dimension mode)"""
+        self.projection = None
+        self.embedding_column = 'embedding'
+        if not self.use_reduced:
+            return
+        
+        try:
+            self.cursor.execute("SELECT target_dim, mean, components FROM embedding_projection;")
+            row = self.cursor.fetchone()
+        except psycopg2.Error:
+            # No projection table - full-dimension mode
+            self.conn.rollback()
+            return
+        
+        if row:
+            self.projection = {
+                'mean': np.asarray(row['mean'], dtype=np.float64),
+                'components': np.asarray(row['components'], dtype=np.float64)
+            }
+            self.embedding_column = 'embedding_reduced'
+            print(f"✓ Reduced-dimension mode: searching {row['target_dim']}-dim PCA vectors")
+    
+    def to_search_vector(self, query_embedding: List[float]) -> List[float]:
+        """Apply the stored PCA projection to a query embedding, if any"""
+        if self.projection is None:
+            return query_embedding
+        centered = np.asarray(query_embedding, dtype=np.float64) - self.projection['mean']
+        return (self.projection['components'] @ centered).tolist()
+    
+    def build_filter_clause(self, alias: str, series=None,
+                            rule_range: Optional[Tuple[str, str]] = None,
+                            candidate_rules: Optional[Dict[str, str]] = None,
+                            require_embedding: bool = True) -> Tuple[str, list]:
+        """
+        Build a WHERE clause restricting a search to rule series and/or a rule number range
+        
+        The series predicate is on the partition key, so PostgreSQL prunes every
+        partition (and its vector index) that cannot match before the ANN scan runs.
+        With require_embedding, near-duplicate rows (NULL embedding) are
+        excluded; vector_search reaches them through their representative.
+        
+        Args:
+            alias: Table alias used in the query (e.g. 's' or 'sm')
+            series: A series ('2000', 2, '2xxx') or a list of them
+            rule_range: Inclusive (low, high) rule numbers, e.g. ('2000', '2999')
+            candidate_rules: Restrict to these rules ({rule_number: rule_series}, the
+                             coarse stage output); their series prune partitions too
+            require_embedding: Only rows with their own embedding
+        """
+        conditions = []
+        params = []
+        
+        if candidate_rules is not None:
+            conditions.append(f"{alias}.rule_number = ANY(%s)")
+            params.append(sorted(candidate_rules))
+        
+        selected = None
+        if series is not None:
+            if isinstance(series, (str, int)):
+                series = [series]
+            selected = {normalize_series(s) for s in series}
+        if candidate_rules is not None:
+            candidate_series = set(candidate_rules.values())
+            selected = candidate_series if selected is None else selected & candidate_series
+        
+        if rule_range is not None:
+            low, high = str(rule_range[0]).strip(), str(rule_range[1]).strip()
+            # Derive the partitions a numeric range can touch so it prunes too
+            if re.match(r'^\d{4}$', low) and re.match(r'^\d{4}$', high):
+                range_series = {f"{d}000" for d in range(int(low[0]), int(high[0]) + 1)}
+                selected = range_series if selected is None else selected & range_series
+            conditions.append(f"{alias}.rule_number BETWEEN %s AND %s")
+            params.extend([low, high])
+        
+        if selected is not None:
+            conditions.insert(0, f"{alias}.rule_series = ANY(%s)")
+            params.insert(0, sorted(selected))
+        
+        if require_embedding:
+            conditions.insert(0, f"{alias}.{self.embedding_column} IS NOT NULL")
+        if not conditions:
+            return "", params
+        return "WHERE " + " AND ".join(conditions), params
+    
+    def select_candidate_rules(self, query_embedding: List[float], series=None,
+                               rule_range: Optional[Tuple[str, str]] = None) -> Optional[Dict[str, str]]:
+        """
+        Coarse stage: pick the coarse_rules rules whose centroid is closest to the query
+        
+        Rules within coarse_margin of the coarse_rules-th score are kept as well,
+        so near-ties are not cut arbitrarily. Returns {rule_number: rule_series}
+        for the candidates, or None (search every rule) when the coarse stage is
+        disabled, too few rules have centroids, or more than twice coarse_rules
+        rules are that close. The rules table is small, so centroids are ranked
+        exactly rather than through an ANN index.
+        """
+        if self.coarse_rules <= 0:
+            return None
+        
+        def build_query():
+            where_clause, filter_params = self.build_filter_clause('r', series, rule_range)
+            return f"""
+                SELECT *, {self.generation_probe} as corpus_generation FROM (
+                    SELECT 
+                        r.rule_number,
+                        r.rule_series,
+                        1 - (r.{self.embedding_column} <=> %s::vector) as similarity
+                    FROM rules r
+                    {where_clause}
+                    OFFSET 0
+                ) centroids
+                ORDER BY similarity DESC
+                LIMIT %s;
+            """, (self.to_search_vector(query_embedding), *filter_params, self.coarse_rules * 2 + 1)
+        
+        ranked = self.run_search(build_query)
+        
+        if len(ranked) <= self.coarse_rules:
+            print(f"Coarse stage skipped ({len(ranked)} rule centroids match) - searching all rules")
+            return None
+        cutoff = ranked[self.coarse_rules - 1]['similarity'] - self.coarse_margin
+        selected = [row for row in ranked if row['similarity'] >= cutoff]
+        if len(selected) > self.coarse_rules * 2:
+            print(f"Coarse stage skipped (ambiguous, over {self.coarse_rules * 2} rules within "
+                  f"{self.coarse_margin} of the cut) - searching all rules")
+            return None
+        
+        candidates = {row['rule_number']: row['rule_series'] for row in selected}
+        print(f"Coarse stage: rules {', '.join(candidates)}")
+        return candidates
+    
+    def search_two_stage(self, query: str, section_k: int = 3, supp_k: int = 2, series=None,
+                         rule_range: Optional[Tuple[str, str]] = None,
+                         query_embedding: Optional[List[float]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Coarse-to-fine search: pick candidate rules by centroid, then rank
+        sections and materials exactly within them
+        
+        Returns (sections, supplementary). Either falls back to the global
+        search when the candidates cannot fill section_k / supp_k; a k of 0
+        skips that search.
+        """
+        if query_embedding is None:
+            query_embedding = self.generate_embedding(query)
+        candidate_rules = self.select_candidate_rules(query_embedding, series, rule_range)
+        
+        sections = []
+        if section_k > 0:
+            sections = self.search_sections(query, section_k, series, rule_range, query_embedding, candidate_rules)
+            if candidate_rules is not None and len(sections) < section_k:
+                print("Candidate rules returned too few sections - searching all rules")
+                sections = self.search_sections(query, section_k, series, rule_range, query_embedding)
+        
+        supplementary = []
+        if supp_k > 0:
+            supplementary = self.search_supplementary(query, supp_k, series, rule_range, query_embedding, candidate_rules)
+            if candidate_rules is not None and len(supplementary) < supp_k:
+                print("Candidate rules returned too few supplementary materials - searching all rules")
+                supplementary = self.search_supplementary(query, supp_k, series, rule_range, query_embedding)
+        
+        return sections, supplementary
+    
+    def search_sections(self, query: str, top_k: int = 5, series=None,
+                        rule_range: Optional[Tuple[str, str]] = None,
+                        query_embedding: Optional[List[float]] = None,
+                        candidate_rules: Optional[Dict[str, str]] = None) -> List[Dict]:
         """
         Search for most relevant sections using vector similarity
-        Returns top_k most similar sections
+        Returns top_k most similar sections, optionally limited to rule series/range
+        or to the candidate rules picked by the coarse stage
         """
         print(f"Searching for: '{query}'")
-        print("Generating query embedding...")
         
         # Generate embedding for the query
-        query_embedding = self.generate_embedding(query)
+        if query_embedding is None:
+            print("Generating query embedding...")
+            query_embedding = self.generate_embedding(query)
+        return self.vector_search('section', query_embedding, top_k, series, rule_range, candidate_rules)
+    
+    def search_supplementary(self, query: str, top_k: int = 3, series=None,
+                             rule_range: Optional[Tuple[str, str]] = None,
+                             query_embedding: Optional[List[float]] = None,
+                             candidate_rules: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """
+        Search supplementary materials using vector similarity
+        """
+        if query_embedding is None:
+            query_embedding = self.generate_embedding(query)
+        return self.vector_search('supplementary', query_embedding, top_k, series, rule_range, candidate_rules)
+    
+    def vector_search(self, kind: str, query_embedding: List[float], top_k: int, series=None,
+                      rule_range: Optional[Tuple[str, str]] = None,
+                      candidate_rules: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """
+        Rank sections or supplementary materials by cosine distance to the query
         
-        # Perform vector similarity search using cosine distance
-        self.cursor.execute("""
-            SELECT 
-                s.id,
-                s.rule_number,
-                s.section_label,
-                s.content,
-                r.title as rule_title,
-                1 - (s.embedding <=> %s::vector) as similarity
-            FROM sections s
-            JOIN rules r ON s.rule_number = r.rule_number
-            ORDER BY s.embedding <=> %s::vector
-            LIMIT %s;
-        """, (query_embedding, query_embedding, top_k))
+        Searches filtered by rule range or candidate rules rank every row passing
+        the filter instead of using the ANN index. Rule-level filters keep only a
+        slice of each partition; as a post-filter on the partition's ivfflat
+        top-k they would lose most true hits, while the slice itself is small
+        and reached through the rule_number btree.
         
-        results = self.cursor.fetchall()
-        return results
+        Filtered searches also rank near-duplicate rows that pass the filter by
+        their representative's embedding, so boilerplate whose representative
+        lies outside the filter is still found. Each near-duplicate cluster is
+        returned once, preferring the representative.
+        """
+        return self.run_search(lambda: self.build_vector_search(
+            kind, self.to_search_vector(query_embedding), top_k, series, rule_range, candidate_rules))
     
-    def search_supplementary(self, query: str, top_k: int = 3) -> List[Dict]:
+    def build_vector_search(self, kind: str, search_vector: List[float], top_k: int, series=None,
+                            rule_range: Optional[Tuple[str, str]] = None,
+                            candidate_rules: Optional[Dict[str, str]] = None) -> Tuple[str, tuple]:
+        """SQL and parameters for vector_search against the current embedding column"""
+        table, alias, columns = SEARCH_TABLES[kind]
+        exact = rule_range is not None or candidate_rules is not None
+        filtered = series is not None or rule_range is not None or candidate_rules is not None
+        column_list = ', '.join(f"{alias}.{column}" for column in columns)
+        distance = f"{alias}.{self.embedding_column} <=> %s::vector"
+        where_clause, filter_params = self.build_filter_clause(alias, series, rule_range, candidate_rules)
+        
+        own_rows = f"""
+            SELECT {column_list}, %s as cluster_kind, {alias}.id as cluster_id,
+                   TRUE as is_representative, {distance} as distance
+            FROM {table} {alias}
+            {where_clause}
         """
-        Search supplementary materials using vector similarity
+        if exact:
+            # OFFSET 0 keeps the subquery from being flattened, so the ORDER BY
+            # sorts the filtered rows rather than walking the vector index
+            ranked = f"SELECT * FROM ({own_rows} OFFSET 0) own ORDER BY distance LIMIT %s"
+            params = [kind, search_vector, *filter_params, top_k]
+        else:
+            ranked = f"{own_rows} ORDER BY {distance} LIMIT %s"
+            params = [kind, search_vector, *filter_params, search_vector, top_k]
+        
+        if filtered:
+            duplicate_where, duplicate_params = self.build_filter_clause(
+                alias, series, rule_range, candidate_rules, require_embedding=False)
+            ranked = f"""
+                ({ranked})
+                UNION ALL
+                (
+                    SELECT {column_list}, nd.representative_kind, nd.representative_id, FALSE,
+                           COALESCE(rs.{self.embedding_column}, rm.{self.embedding_column}) <=> %s::vector as distance
+                    FROM near_duplicates nd
+                    JOIN {table} {alias}
+                        ON {alias}.rule_series = nd.duplicate_series AND {alias}.id = nd.duplicate_id
+                    LEFT JOIN sections rs
+                        ON nd.representative_kind = 'section'
+                        AND rs.rule_series = nd.representative_series AND rs.id = nd.representative_id
+                    LEFT JOIN supplementary_materials rm
+                        ON nd.representative_kind = 'supplementary'
+                        AND rm.rule_series = nd.representative_series AND rm.id = nd.representative_id
+                    {duplicate_where} AND nd.duplicate_kind = %s
+                    ORDER BY distance
+                    LIMIT %s
+                )
+            """
+            params += [search_vector, *duplicate_params, kind, top_k]
+        
+        return f"""
+            WITH hits AS ({ranked}),
+            clusters AS (
+                SELECT DISTINCT ON (cluster_kind, cluster_id) *
+                FROM hits
+                ORDER BY cluster_kind, cluster_id, distance, is_representative DESC
+            )
+            SELECT {', '.join(f"c.{column}" for column in columns)},
+                   c.cluster_kind,
+                   c.cluster_id,
+                   r.title as rule_title,
+                   1 - c.distance as similarity,
+                   {self.generation_probe} as corpus_generation
+            FROM clusters c
+            JOIN rules r ON c.rule_number = r.rule_number
+            ORDER BY c.distance
+            LIMIT %s;
+        """, (*params, top_k)
+    
+    def get_related_sections(self, sections: List[Dict], related_k: int = 5) -> List[Dict]:
         """
-        query_embedding = self.generate_embedding(query)
+        Expand section hits through the citation graph in a single query
+        
+        Returns rows with relation 'cited' (sections the hits refer to) and
+        'citing' (sections/materials that refer to the hits). Citations of a
+        whole rule (no paragraph) match every section of that rule.
+        """
+        if not sections:
+            return []
+        
+        hit_rules = [s['rule_number'] for s in sections]
+        hit_labels = [s['section_label'] for s in sections]
         
         self.cursor.execute("""
-            SELECT 
-                sm.id,
-                sm.rule_number,
-                sm.material_number,
-                sm.title,
-                sm.content,
-                r.title as rule_title,
-                1 - (sm.embedding <=> %s::vector) as similarity
-            FROM supplementary_materials sm
-            JOIN rules r ON sm.rule_number = r.rule_number
-            ORDER BY sm.embedding <=> %s::vector
-            LIMIT %s;
-        """, (query_embedding, query_embedding, top_k))
+            WITH hits AS (
+                SELECT * FROM unnest(%s::varchar[], %s::varchar[]) AS h(rule_number, section_label)
+            )
+            (
+                SELECT DISTINCT ON (s.rule_number, s.section_label)
+                    'cited' as relation,
+                    h.rule_number as via_rule,
+                    h.section_label as via_label,
+                    'section' as kind,
+                    s.rule_number,
+                    s.section_label as label,
+                    s.document_id,
+                    s.start_offset,
+                    s.end_offset,
+                    r.title as rule_title
+                FROM hits h
+                JOIN rule_citations c
+                    ON c.from_kind = 'section'
+                    AND c.from_rule = h.rule_number
+                    AND c.from_label = h.section_label
+                JOIN sections s
+                    ON s.rule_number = c.to_rule
+                    AND (c.to_label IS NULL OR s.section_label = c.to_label)
+                JOIN rules r ON s.rule_number = r.rule_number
+                ORDER BY s.rule_number, s.section_label
+                LIMIT %s
+            )
+            UNION ALL
+            (
+                SELECT DISTINCT ON (c.from_rule, c.from_kind, c.from_label)
+                    'citing' as relation,
+                    h.rule_number as via_rule,
+                    h.section_label as via_label,
+                    c.from_kind as kind,
+                    c.from_rule as rule_number,
+                    c.from_label as label,
+                    COALESCE(s.document_id, sm.document_id) as document_id,
+                    COALESCE(s.start_offset, sm.start_offset) as start_offset,
+                    COALESCE(s.end_offset, sm.end_offset) as end_offset,
+                    r.title as rule_title
+                FROM hits h
+                JOIN rule_citations c
+                    ON c.to_rule = h.rule_number
+                    AND (c.to_label IS NULL OR c.to_label = h.section_label)
+                LEFT JOIN sections s
+                    ON c.from_kind = 'section'
+                    AND s.rule_number = c.from_rule
+                    AND s.section_label = c.from_label
+                LEFT JOIN supplementary_materials sm
+                    ON c.from_kind = 'supplementary'
+                    AND sm.rule_number = c.from_rule
+                    AND sm.material_number = c.from_label
+                JOIN rules r ON c.from_rule = r.rule_number
+                ORDER BY c.from_rule, c.from_kind, c.from_label
+                LIMIT %s
+            );
+        """, (hit_rules, hit_labels, related_k, related_k))
         
-        results = self.cursor.fetchall()
-        return results
+        # Drop rows that are already among the vector hits
+        hit_keys = set(zip(hit_rules, hit_labels))
+        return [
+            row for row in self.cursor.fetchall()
+            if not (row['kind'] == 'section' and (row['rule_number'], row['label']) in hit_keys)
+        ]
     
-    def search_combined(self, query: str, section_k: int = 3, supp_k: int = 2) -> Dict:
+    def search_combined(self, query: str, section_k: int = 3, supp_k: int = 2, series=None,
+                        rule_range: Optional[Tuple[str, str]] = None,
+                        expand_related: bool = False, related_k: int = 5) -> Dict:
         """
         Search both sections and supplementary materials
-        Returns combined results
+        Returns combined results, plus cited/citing sections when expand_related is set
+        
+        Results are served from the query cache when the same (or a near-identical)
+        question was asked with the same parameters in the current corpus generation.
+        
+        Searches run coarse-to-fine (see search_two_stage).
         """
-        sections = self.search_sections(query, section_k)
-        supplementary = self.search_supplementary(query, supp_k)
+        if series is not None:
+            series_key = tuple(sorted({normalize_series(x) for x in
+                                       ([series] if isinstance(series, (str, int)) else series)}))
+        else:
+            series_key = None
+        range_key = tuple(str(x).strip() for x in rule_range) if rule_range is not None else None
+        params = (section_k, supp_k, series_key, range_key, expand_related, related_k)
         
-        return {
+        self.refresh_corpus_generation()
+        
+        if self.cache is not None:
+            cached = self.cache.get_exact(query, params)
+            if cached is not None:
+                print(f"✓ Cache hit (exact): '{query}'")
+                return cached
+        
+        query_embedding = self.generate_embedding(query)
+        
+        if self.cache is not None:
+            cached = self.cache.get_similar(query_embedding, params)
+            if cached is not None:
+                print(f"✓ Cache hit (near-duplicate): '{query}'")
+                return cached
+        
+        sections, supplementary = self.search_two_stage(query, section_k, supp_k, series, rule_range, query_embedding)
+        
+        results = {
             'sections': sections,
             'supplementary': supplementary
         }
+        if expand_related:
+            results['related'] = self.get_related_sections(sections, related_k)
+        
+        if self.cache is not None:
+            self.cache.put(query, params, query_embedding, results)
+        return results
+    
+    def materialize_content(self, rows: List[Dict]):
+        """
+        Fill row['content'] and row['source_key'] from document offsets in one query
+        
+        Search results only carry (document_id, start_offset, end_offset); the
+        text is cut out of the stored document when an answer is rendered.
+        Rows that already have content (e.g. cached results) are skipped.
+        """
+        pending = [row for row in rows if 'content' not in row and row.get('document_id') is not None]
+        if not pending:
+            return
+        
+        self.cursor.execute("""
+            SELECT t.idx, d.source_key,
+                   substr(d.content, t.start_offset + 1, t.end_offset - t.start_offset) as content
+            FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[])
+                AS t(idx, document_id, start_offset, end_offset)
+            JOIN documents d ON d.id = t.document_id;
+        """, (
+            list(range(len(pending))),
+            [row['document_id'] for row in pending],
+            [row['start_offset'] for row in pending],
+            [row['end_offset'] for row in pending]
+        ))
+        
+        for fetched in self.cursor.fetchall():
+            row = pending[fetched['idx']]
+            row['content'] = fetched['content']
+            row['source_key'] = fetched['source_key']
+    
+    def attach_occurrences(self, results: Dict):
+        """
+        Add row['occurrences'] to section/material hits that belong to a
+        near-duplicate cluster, listing where else the same text appears
+        """
+        hits = [('section', row) for row in results['sections']] + \
+               [('supplementary', row) for row in results['supplementary']]
+        pending = [(kind, row) for kind, row in hits if 'occurrences' not in row and 'id' in row]
+        if not pending:
+            return
+        
+        # Every member of each hit's cluster: the representative and its duplicates
+        self.cursor.execute("""
+            WITH clusters AS (
+                SELECT DISTINCT * FROM unnest(%s::varchar[], %s::int[]) AS h(kind, id)
+            ),
+            members AS (
+                SELECT nd.representative_kind as cluster_kind, nd.representative_id as cluster_id,
+                       nd.duplicate_kind as kind, nd.duplicate_series as rule_series, nd.duplicate_id as id
+                FROM clusters c
+                JOIN near_duplicates nd
+                    ON nd.representative_kind = c.kind AND nd.representative_id = c.id
+                UNION
+                SELECT nd.representative_kind, nd.representative_id,
+                       nd.representative_kind, nd.representative_series, nd.representative_id
+                FROM clusters c
+                JOIN near_duplicates nd
+                    ON nd.representative_kind = c.kind AND nd.representative_id = c.id
+            )
+            SELECT m.cluster_kind, m.cluster_id, m.kind, m.id,
+                   COALESCE(s.rule_number, sm.rule_number) as rule_number,
+                   COALESCE(s.section_label, sm.material_number) as label
+            FROM members m
+            LEFT JOIN sections s
+                ON m.kind = 'section' AND s.rule_series = m.rule_series AND s.id = m.id
+            LEFT JOIN supplementary_materials sm
+                ON m.kind = 'supplementary' AND sm.rule_series = m.rule_series AND sm.id = m.id
+            ORDER BY rule_number, label;
+        """, ([row.get('cluster_kind', kind) for kind, row in pending],
+              [row.get('cluster_id', row['id']) for _, row in pending]))
+        
+        members = {}
+        for link in self.cursor.fetchall():
+            if link['kind'] == 'supplementary':
+                location = f"Rule {link['rule_number']}.{link['label']}"
+            else:
+                location = f"Rule {link['rule_number']}({link['label']})"
+            key = (link['cluster_kind'], link['cluster_id'])
+            members.setdefault(key, []).append(((link['kind'], link['id']), location))
+        
+        for kind, row in pending:
+            cluster = members.get((row.get('cluster_kind', kind), row.get('cluster_id', row['id'])), [])
+            row['occurrences'] = [location for member, location in cluster if member != (kind, row['id'])]
+    
+    def format_occurrences(self, row: Dict) -> str:
+        """Other places the same (near-duplicate) text appears"""
+        if not row.get('occurrences'):
+            return ""
+        return f"   Also appears in: {', '.join(row['occurrences'])}\n"
+    
+    def format_provenance(self, row: Dict) -> str:
+        """Source document and character span of an answer snippet"""
+        if not row.get('source_key'):
+            return ""
+        return f"   Source: {row['source_key']} [chars {row['start_offset']}-{row['end_offset']}]\n"
     
     def format_answer(self, results: Dict, show_scores: bool = True) -> str:
         """
         Format search results into a readable answer
         """
+        self.materialize_content(results['sections'] + results['supplementary'] + results.get('related', []))
+        self.attach_occurrences(results)
+        
         answer = "\n" + "="*80 + "\n"
         answer += "ANSWER\n"
         answer += "="*80 + "\n"
@@ -125,11 +795,13 @@ class FINRAQuestionAnswering:
                 answer += "\n\n"
                 
                 # Show content (truncate if too long)
-                content = section['content']
+                content = section.get('content') or ''
                 if len(content) > 500:
                     content = content[:500] + "..."
                 
                 answer += f"   {content}\n"
+                answer += self.format_provenance(section)
+                answer += self.format_occurrences(section)
                 answer += "-"*80 + "\n"
         
         # Format supplementary materials
@@ -148,16 +820,46 @@ class FINRAQuestionAnswering:
                 answer += "\n\n"
                 
                 # Show content (truncate if too long)
-                content = supp['content']
+                content = supp.get('content') or ''
                 if len(content) > 400:
                     content = content[:400] + "..."
                 
                 answer += f"   {content}\n"
+                answer += self.format_provenance(supp)
+                answer += self.format_occurrences(supp)
+                answer += "-"*80 + "\n"
+        
+        # Format cross-referenced sections
+        if results.get('related'):
+            answer += "\n🔗 RELATED BY CITATION:\n"
+            answer += "-"*80 + "\n"
+            
+            for i, related in enumerate(results['related'], 1):
+                if related['kind'] == 'supplementary':
+                    location = f"Rule {related['rule_number']}.{related['label']}"
+                else:
+                    location = f"Rule {related['rule_number']}({related['label']})"
+                
+                if related['relation'] == 'cited':
+                    link = f"cited by Rule {related['via_rule']}({related['via_label']})"
+                else:
+                    link = f"cites Rule {related['via_rule']}({related['via_label']})"
+                
+                answer += f"\n{i}. {location}: {related['rule_title']} | {link}\n\n"
+                
+                content = related.get('content') or ''
+                if len(content) > 300:
+                    content = content[:300] + "..."
+                
+                answer += f"   {content}\n"
+                answer += self.format_provenance(related)
                 answer += "-"*80 + "\n"
         
         return answer
     
-    def ask(self, question: str, section_k: int = 3, supp_k: int = 2, show_scores: bool = True) -> str:
+    def ask(self, question: str, section_k: int = 3, supp_k: int = 2, show_scores: bool = True,
+            series=None, rule_range: Optional[Tuple[str, str]] = None,
+            expand_related: bool = False) -> str:
         """
         Main Q&A method - ask a question and get formatted answer
         
@@ -166,8 +868,12 @@ class FINRAQuestionAnswering:
             section_k: Number of relevant sections to retrieve
             supp_k: Number of supplementary materials to retrieve
             show_scores: Whether to show similarity scores
+            series: Optional rule series filter (e.g. '2000' or ['2000', '3000'])
+            rule_range: Optional inclusive rule number range (e.g. ('5100', '5199'))
+            expand_related: Also return sections cited by / citing the top sections
         """
-        results = self.search_combined(question, section_k, supp_k)
+        results = self.search_combined(question, section_k, supp_k, series, rule_range,
+                                       expand_related=expand_related)
         answer = self.format_answer(results, show_scores)
         return answer
     
@@ -184,9 +890,15 @@ class FINRAQuestionAnswering:
         if not rule:
             return None
         
+        # Get the source document once; section text is cut from it by offset
+        self.cursor.execute("""
+            SELECT source_key, content FROM documents WHERE rule_number = %s;
+        """, (rule_number,))
+        document = self.cursor.fetchone()
+        
         # Get sections
         self.cursor.execute("""
-            SELECT section_label, content 
+            SELECT section_label, start_offset, end_offset 
             FROM sections 
             WHERE rule_number = %s 
             ORDER BY section_label;
@@ -195,15 +907,20 @@ class FINRAQuestionAnswering:
         
         # Get supplementary materials
         self.cursor.execute("""
-            SELECT material_number, title, content 
+            SELECT material_number, title, start_offset, end_offset 
             FROM supplementary_materials 
             WHERE rule_number = %s 
             ORDER BY material_number;
         """, (rule_number,))
         supplementary = self.cursor.fetchall()
         
+        text = document['content'] if document else ''
+        for row in sections + supplementary:
+            row['content'] = text[row['start_offset']:row['end_offset']]
+        
         return {
             'rule': rule,
+            'source_key': document['source_key'] if document else None,
             'sections': sections,
             'supplementary': supplementary
         }
@@ -218,6 +935,8 @@ class FINRAQuestionAnswering:
         print("\nCommands:")
         print("  - Type your question to search")
         print("  - 'rule XXXX' to get full details of a rule (e.g., 'rule 5131')")
+        print("  - 'series XXXX <question>' to search one rule series (e.g., 'series 5000 spinning')")
+        print("  - 'related <question>' to also show cited and citing sections")
         print("  - 'exit' or 'quit' to exit")
         print("="*80 + "\n")
         
@@ -239,6 +958,8 @@ class FINRAQuestionAnswering:
                     
                     if details:
                         print(f"\n📜 Rule {rule_number}: {details['rule']['title']}")
+                        if details['source_key']:
+                            print(f"Source: {details['source_key']}")
                         print("="*80)
                         
                         print("\nSections:")
@@ -256,6 +977,23 @@ class FINRAQuestionAnswering:
                     
                     continue
                 
+                # Question restricted to one rule series
+                if user_input.lower().startswith('series '):
+                    parts = user_input.split(None, 2)
+                    if len(parts) < 3:
+                        print("\n❌ Usage: series XXXX <question>")
+                        continue
+                    answer = self.ask(parts[2], section_k=3, supp_k=2, show_scores=True, series=parts[1])
+                    print(answer)
+                    continue
+                
+                # Question expanded through the citation graph
+                if user_input.lower().startswith('related '):
+                    answer = self.ask(user_input[8:].strip(), section_k=3, supp_k=2, show_scores=True,
+                                      expand_related=True)
+                    print(answer)
+                    continue
+                
                 # Regular question
                 answer = self.ask(user_input, section_k=3, supp_k=2, show_scores=True)
                 print(answer)